@@ -105,6 +105,7 @@ def relay_cmd_status(args, **kwargs):
         print('Status relay:')
         _relay_board.print_status(relays[0])
     elif relays and len(relays) > 1:
+        # Read multiple relays with one transaction
         print('Status relays:')
         _relay_board.print_status_multi(relays, indent=True)
 
@@ -31,9 +31,13 @@
 #
 
 import time
+from functools import partial
 
 import relay_modbus
 
+# Imported after relay_modbus, which reports a missing futures backport on Python 2.7
+from concurrent.futures import Future
+
 
 # Fixed board type string
 BOARD_TYPE = 'R421A08'
@@ -55,6 +59,13 @@ CMD_LATCH = 0x04
 CMD_MOMENTARY = 0x05
 CMD_DELAY = 0x06
 
+# Whole board commands, send to relay 0
+CMD_ON_ALL = 0x07
+CMD_OFF_ALL = 0x08
+
+# Relay number of whole board commands
+RELAY_ALL = 0x00
+
 # R421A08 supports MODBUS control command and read status only
 FUNCTION_CONTROL_COMMAND = 0x06
 FUNCTION_READ_STATUS = 0x03
@@ -63,11 +74,275 @@ FUNCTION_READ_STATUS = 0x03
 RX_LEN_CONTROL_COMMAND = 8
 RX_LEN_READ_STATUS = 7
 
+# Consecutive failures of a read status all relays or whole board frame answered by single relay
+# frames before the frame is skipped. A rejected frame is skipped immediately.
+MAX_FRAME_FAILURES = 3
+
+
+# Operation of queued read status transactions, merged with queued commands of the same relay
+OPERATION_READ_STATUS = 'status'
+
+# Request frames including CRC with the expected response (prefix), created on first use
+_frame_cache = {}
+
 
 class ModbusException(Exception):
     pass
 
 
+class FrameSupport(object):
+    """ Support of an optional frame of a relay board, such as read status all relays """
+
+    def __init__(self, supported=True):
+        """
+            FrameSupport constructor
+        :param supported: Use the frame until the board rejects it or does not answer it
+            repeatedly
+        """
+        self.supported = bool(supported)
+        self.failures = 0
+
+    def succeeded(self):
+        """
+            Frame answered by the board
+        :return: None
+        """
+        self.failures = 0
+
+    def failed(self, exception=None):
+        """
+            Frame not answered by the board. A rejected frame is skipped after the fallback,
+            other failures after MAX_FRAME_FAILURES consecutive failures.
+        :param exception: Exception of the frame, None when the response was incorrect
+        :return: None
+        """
+        if isinstance(exception, relay_modbus.SlaveException):
+            self.failures = MAX_FRAME_FAILURES
+        else:
+            self.failures += 1
+
+    def fallback_succeeded(self):
+        """
+            Single relay frames answered after a failure of the frame
+        :return: None
+        """
+        if self.failures >= MAX_FRAME_FAILURES:
+            # Board answers single relay frames only: Skip frame from now on
+            self.supported = False
+
+
+def get_control_frame(address, relay, cmd, delay=0):
+    """
+        Get control command frame
+    :param address: Slave address of the relay board 0..63
+    :param relay: Relay 1..8 or 0 for all relays
+    :param cmd: Command
+    :param delay: Delay 0..255
+    :return: Tuple request frame including CRC (bytes), expected response (bytes)
+    """
+    key = (FUNCTION_CONTROL_COMMAND, address, relay, cmd, delay)
+
+    frame = _frame_cache.get(key)
+    if frame is None:
+        # Create binary control command
+        tx_data = bytearray((
+            address,                    # Slave address of the relay board 0..63
+            FUNCTION_CONTROL_COMMAND,   # Control command is always 0x06
+            0x00, relay,                # Relay 0x0001..0x0008 or 0x0000 for all relays
+            cmd,                        # Command 0x01..0x08
+            delay                       # Delay 0x00..0xFF
+        ))
+        tx_frame = bytes(tx_data + relay_modbus.crc16_bytes(tx_data))
+
+        # The response of a control command is an echo of the request
+        frame = (tx_frame, tx_frame)
+        _frame_cache[key] = frame
+
+    return frame
+
+
+def get_status_length(count=1):
+    """
+        Get read status response length
+    :param count: Number of relays
+    :return: Address, function, length, 2 Bytes per relay and CRC
+    """
+    return 5 + (2 * count)
+
+
+def get_status_frame(address, relay, count=1):
+    """
+        Get read status frame
+    :param address: Slave address of the relay board 0..63
+    :param relay: First relay 1..8
+    :param count: Number of relays
+    :return: Tuple request frame including CRC (bytes), expected response prefix (bytes)
+    """
+    key = (FUNCTION_READ_STATUS, address, relay, count)
+
+    frame = _frame_cache.get(key)
+    if frame is None:
+        # Create binary read status
+        tx_data = bytearray((
+            address,                # Slave address of the relay board 0..63
+            FUNCTION_READ_STATUS,   # Read status is always 0x03
+            0x00, relay,            # Relay 0x0001..0x0008
+            0x00, count             # Number of relays 0x0001..0x0008
+        ))
+        tx_frame = bytes(tx_data + relay_modbus.crc16_bytes(tx_data))
+
+        # Response starts with address, function and number of data Bytes
+        frame = (tx_frame, bytes(bytearray((address, FUNCTION_READ_STATUS, 2 * count))))
+        _frame_cache[key] = frame
+
+    return frame
+
+
+def _check_status_response(rx_data, rx_prefix):
+    """
+        Check read status response
+    :param rx_data: Received frame
+    :param rx_prefix: Expected response prefix
+    :return: None
+    """
+    if rx_data[:len(rx_prefix)] == rx_prefix and relay_modbus.crc16_check(rx_data):
+        return
+
+    if not relay_modbus.crc16_check(rx_data):
+        raise ModbusException('RX error: Incorrect CRC received')
+    elif rx_data[0] != rx_prefix[0]:
+        raise ModbusException('RX error: Incorrect address received')
+    elif rx_data[1] != rx_prefix[1]:
+        raise ModbusException('RX error: Incorrect function received')
+    else:
+        raise ModbusException('RX error: Incorrect data length received')
+
+
+def parse_control_response(rx_expected, rx_frame):
+    """
+        Parse control command response
+    :param rx_expected: Expected response
+    :param rx_frame: Received frame
+    :return:
+        True: Command echoed by the relay board
+        False: Incorrect response
+    """
+    # Check response from relay: Echo of the command
+    return rx_frame == rx_expected
+
+
+def parse_status_response(rx_prefix, rx_frame):
+    """
+        Parse read status response of one relay
+    :param rx_prefix: Expected response prefix
+    :param rx_frame: Received frame
+    :return:
+        0: Relay off
+        1: Relay on
+        -1: An error occurred
+    """
+    if rx_frame and len(rx_frame) > 2:
+        # Check CRC, address, function and data length
+        _check_status_response(rx_frame, rx_prefix)
+
+        if rx_frame[3] != 0:
+            raise ModbusException('RX error: Incorrect data high Byte received')
+        elif rx_frame[4] != 0 and rx_frame[4] != 1:
+            raise ModbusException('RX error: Incorrect data low Byte received')
+        else:
+            return rx_frame[4]
+
+    return -1
+
+
+def parse_status_all_response(rx_prefix, num_relays, rx_frame):
+    """
+        Parse read status response of all relays
+    :param rx_prefix: Expected response prefix
+    :param num_relays: Number of relays
+    :param rx_frame: Received frame
+    :return: Dictionary with relay status {number: status, ...}
+    """
+    # Check CRC, address, function and data length
+    _check_status_response(rx_frame, rx_prefix)
+
+    relay_status = {}
+    for relay in range(1, num_relays + 1):
+        status_high = rx_frame[1 + (2 * relay)]
+        status_low = rx_frame[2 + (2 * relay)]
+        if status_high != 0:
+            raise ModbusException('RX error: Incorrect data high Byte received')
+        elif status_low != 0 and status_low != 1:
+            raise ModbusException('RX error: Incorrect data low Byte received')
+        relay_status[relay] = status_low
+
+    return relay_status
+
+
+def _completed_future(result):
+    """
+        Create completed future
+    :param result: Result
+    :return: Future with the result
+    """
+    future = Future()
+    future.set_running_or_notify_cancel()
+    future.set_result(result)
+    return future
+
+
+def _answer_status(status, result):
+    """
+        Convert result of a queued on/off command to the relay status
+    :param status: Relay status after the command
+    :param result: Command result, None when failed
+    :return: Relay status (0 = off, 1 = on, -1 = unknown)
+    """
+    if result:
+        return status
+    return -1
+
+
+def _merge_relay_operation(get_command, pending, transaction):
+    """
+        Merge new transaction with a queued command of the same relay
+    :param get_command: Function(relay, cmd) returning a tuple (tx_frame, parser) of the board
+    :param pending: Queued transaction with CMD_ON, CMD_OFF or CMD_TOGGLE
+    :param transaction: New transaction with CMD_ON, CMD_OFF, CMD_TOGGLE or
+        OPERATION_READ_STATUS
+    :return: Tuple (relay_modbus.COALESCE_*, argument)
+    """
+    if transaction.operation == OPERATION_READ_STATUS:
+        # Read status from the result of the queued command
+        if pending.operation == CMD_ON:
+            return relay_modbus.COALESCE_ANSWER, partial(_answer_status, 1)
+        elif pending.operation == CMD_OFF:
+            return relay_modbus.COALESCE_ANSWER, partial(_answer_status, 0)
+    elif transaction.operation in (CMD_ON, CMD_OFF):
+        # Latest state wins
+        return relay_modbus.COALESCE_REPLACE, transaction
+    elif transaction.operation == CMD_TOGGLE:
+        if pending.operation == CMD_TOGGLE:
+            # Two toggles cancel each other out
+            return relay_modbus.COALESCE_CANCEL, True
+
+        # Toggle after on/off results in a known state
+        if pending.operation == CMD_ON:
+            cmd = CMD_OFF
+        else:
+            cmd = CMD_ON
+        tx_frame, parser = get_command(transaction.key[1], cmd)
+        replacement = relay_modbus.Transaction(tx_frame, RX_LEN_CONTROL_COMMAND, parser,
+                                               deadline=transaction.deadline,
+                                               key=transaction.key,
+                                               group=transaction.group,
+                                               operation=cmd,
+                                               merge=pending.merge)
+        return relay_modbus.COALESCE_REPLACE, replacement
+
+    return relay_modbus.COALESCE_NONE, None
+
+
 class R421A08(object):
     """ R421A08 relay board class """
     def __init__(self,
@@ -76,6 +351,10 @@ class R421A08(object):
                  board_name='Relay board {}'.format(BOARD_TYPE),
                  num_address=NUM_ADDRESSES,
                  num_relays=NUM_RELAYS,
+                 whole_board_commands=True,
+                 priority=None,
+                 deadline=None,
+                 cache_ttl=None,
                  verbose=False):
         """
             R421A08 relay board constructor
@@ -84,6 +363,17 @@ class R421A08(object):
         :param board_name:
         :param num_address:
         :param num_relays:
+        :param whole_board_commands:
+            True: Turn all relays on/off with one frame (Default)
+            False: Turn all relays on/off with one frame per relay
+        :param priority: Scheduler priority of all transactions, for example
+            relay_modbus.PRIORITY_INTERACTIVE for user actions. Default None: PRIORITY_CONTROL for
+            commands and PRIORITY_BACKGROUND for reading status.
+        :param deadline: Maximum time in seconds a transaction may wait in the scheduler queue
+            before it is dropped with a relay_modbus.DeadlineException. Default None: No deadline.
+        :param cache_ttl: Time in seconds a relay state from a command echo or status read is
+            returned by get_status() and get_status_all() without reading the board.
+            Default None: Always read the board.
         :param verbose:
             False: Normal prints (Default)
             True: Print verbose messages
@@ -105,6 +395,24 @@ class R421A08(object):
         self._num_addresses = int(num_address)
         self._num_relays = int(num_relays)
 
+        # Read status all relays with a single frame
+        self._status_all = FrameSupport()
+
+        # Turn all relays on/off with a single frame
+        self._whole_board = FrameSupport(whole_board_commands)
+
+        # Scheduler priority
+        self.priority = priority
+
+        # Scheduler queue deadline
+        self.deadline = deadline
+
+        # Shadow state of the relays {relay: (status, timestamp), ...}
+        self._shadow = {}
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self.cache_ttl = cache_ttl
+
     # ----------------------------------------------------------------------------------------------
     # Relay board properties
     # ----------------------------------------------------------------------------------------------
@@ -137,6 +445,11 @@ class R421A08(object):
         address = int(address)
 
         if address >= 0 and address < self._num_addresses:
+            if address != self._address:
+                # Shadow state belongs to the previous board
+                self._shadow.clear()
+                self._cache_hits = 0
+                self._cache_misses = 0
             self._address = address
 
     @property
@@ -147,16 +460,286 @@ class R421A08(object):
     def num_relays(self):
         return self._num_relays
 
+    @property
+    def status_all_supported(self):
+        return self._status_all.supported
+
+    @property
+    def whole_board_supported(self):
+        return self._whole_board.supported
+
+    @property
+    def priority(self):
+        return self._priority
+
+    @priority.setter
+    def priority(self, priority):
+        assert priority is None or priority in relay_modbus.scheduler.PRIORITIES
+        self._priority = priority
+
+    @property
+    def batch_key(self):
+        # Batches are executed ordered by serial port and address
+        return self._modbus.serial_port or '', self._address
+
+    @property
+    def cache_ttl(self):
+        return self._cache_ttl
+
+    @cache_ttl.setter
+    def cache_ttl(self, cache_ttl):
+        assert cache_ttl is None or cache_ttl >= 0
+        self._cache_ttl = cache_ttl
+        self._shadow.clear()
+
+    @property
+    def cache_hits(self):
+        return self._cache_hits
+
+    @property
+    def cache_misses(self):
+        return self._cache_misses
+
+    @property
+    def deadline(self):
+        return self._deadline
+
+    @deadline.setter
+    def deadline(self, deadline):
+        assert deadline is None or deadline >= 0
+        self._deadline = deadline
+
     # ----------------------------------------------------------------------------------------------
     # Relay board private functions
     # ----------------------------------------------------------------------------------------------
+    def _get_shadow(self, relays):
+        """
+            Get relay states from the shadow state when not expired
+        :param relays: List relays (int)
+        :return: Dictionary with relay status {number: status, ...} or None when a relay state
+            is unknown or expired
+        """
+        if self._cache_ttl is None:
+            return None
+
+        expired = relay_modbus.modbus.monotonic() - self._cache_ttl
+        relay_status = {}
+        for relay in relays:
+            state = self._shadow.get(relay)
+            if state is None or state[1] < expired:
+                self._cache_misses += 1
+                return None
+            relay_status[relay] = state[0]
+
+        self._cache_hits += 1
+        return relay_status
+
+    def _set_shadow(self, relay_status):
+        """
+            Store relay states in the shadow state, unknown states are removed
+        :param relay_status: Dictionary with relay status {number: status, ...}
+        :return: None
+        """
+        if self._cache_ttl is None:
+            return
+
+        now = relay_modbus.modbus.monotonic()
+        for relay, status in relay_status.items():
+            if status in (0, 1):
+                self._shadow[relay] = (status, now)
+            else:
+                self._shadow.pop(relay, None)
+
+    def invalidate_cache(self, relay=None):
+        """
+            Remove relay states from the shadow state
+        :param relay: Relay number, None for all relays
+        :return: None
+        """
+        if relay is None or relay == RELAY_ALL:
+            self._shadow.clear()
+        else:
+            self._shadow.pop(relay, None)
+
+    def _update_shadow(self, relay, cmd, result):
+        """
+            Update shadow state with the result of a relay command
+        :param relay: Relay number
+        :param cmd: Command
+        :param result: True when echoed by the relay board
+        :return: None
+        """
+        if self._cache_ttl is None:
+            return
+
+        if not result:
+            self.invalidate_cache(relay)
+        elif cmd == CMD_ON:
+            self._set_shadow({relay: 1})
+        elif cmd == CMD_OFF:
+            self._set_shadow({relay: 0})
+        elif cmd == CMD_TOGGLE:
+            # Toggle a known state only, an expired state remains expired
+            state = self._shadow.get(relay)
+            if state is not None and \
+                    state[1] >= relay_modbus.modbus.monotonic() - self._cache_ttl:
+                self._set_shadow({relay: 1 - state[0]})
+            else:
+                self.invalidate_cache(relay)
+        elif cmd == CMD_LATCH:
+            # Latch turns the relay on and all other relays off
+            relay_status = dict((number, 0) for number in range(1, self._num_relays + 1))
+            relay_status[relay] = 1
+            self._set_shadow(relay_status)
+        elif cmd == CMD_ON_ALL:
+            self._set_shadow(dict((number, 1) for number in range(1, self._num_relays + 1)))
+        elif cmd == CMD_OFF_ALL:
+            self._set_shadow(dict((number, 0) for number in range(1, self._num_relays + 1)))
+        else:
+            # Momentary and delay change state after the echo
+            self.invalidate_cache(relay)
+
+    def _get_command(self, relay, cmd, delay=0):
+        """
+            Get relay control frame with a parser updating the shadow state
+        :param relay: Relay number
+        :param cmd: Command
+        :param delay: Optional delay
+        :return: Tuple request frame including CRC (bytes), parser function
+        """
+        tx_frame, rx_expected = get_control_frame(self._address, relay, cmd, delay)
+
+        return tx_frame, partial(self._parse_command_response, relay, cmd, rx_expected)
+
+    def _parse_command_response(self, relay, cmd, rx_expected, rx_frame):
+        """
+            Parse relay control response and update the shadow state with the transmitted
+            command. A queued command may be merged with other commands by the scheduler, so the
+            shadow state is not updated with the command of the caller.
+        :param relay: Relay number
+        :param cmd: Transmitted command
+        :param rx_expected: Expected response
+        :param rx_frame: Received frame
+        :return:
+            True: Command echoed by the relay board
+            False: Incorrect response
+        """
+        result = parse_control_response(rx_expected, rx_frame)
+        self._update_shadow(relay, cmd, result)
+
+        return result
+
+    def _command_done(self, relay, future):
+        """
+            Invalidate shadow state when a queued relay command failed
+        :param relay: Relay number
+        :param future: Future of the command
+        :return: None
+        """
+        if future.cancelled() or future.exception() is not None:
+            self.invalidate_cache(relay)
+
+    def _status_done(self, relay, future):
+        """
+            Update shadow state when a queued read status is completed
+        :param relay: Relay number
+        :param future: Future of the read status
+        :return: None
+        """
+        if future.cancelled() or future.exception() is not None:
+            self.invalidate_cache(relay)
+        else:
+            self._set_shadow({relay: future.result()})
+
+    def _create_transaction(self, tx_frame, rx_length, parser, priority, deadline=None,
+                            relay=None, operation=None):
+        """
+            Create scheduler transaction
+        :param tx_frame: Frame including CRC
+        :param rx_length: Receive length
+        :param parser: Function to convert the received frame to the result
+        :param priority: Scheduler priority when not configured for this board
+        :param deadline: Deadline in seconds, None for the deadline of this board
+        :param relay: Relay number of single relay transactions
+        :param operation: Command or OPERATION_READ_STATUS of single relay transactions
+        :return: Transaction object
+        """
+        if self._priority is not None:
+            priority = self._priority
+        if deadline is None:
+            deadline = self._deadline
+
+        # On, off, toggle and read status of one relay are merged with queued commands.
+        # Other transactions are not reordered with transactions of the same board.
+        key = None
+        merge = None
+        if relay and operation in (CMD_ON, CMD_OFF, CMD_TOGGLE, OPERATION_READ_STATUS):
+            key = (self._address, relay)
+            if operation != OPERATION_READ_STATUS:
+                merge = partial(_merge_relay_operation, self._get_command)
+
+        return relay_modbus.Transaction(tx_frame, rx_length, parser,
+                                        priority=priority, deadline=deadline,
+                                        key=key, group=self._address,
+                                        operation=operation, merge=merge)
+
+    def _transfer(self, tx_frame, rx_length, parser, priority=relay_modbus.PRIORITY_CONTROL,
+                  relay=None, operation=None):
+        """
+            Transmit frame and parse response, via the scheduler when started. The serial port is
+            locked during the transaction.
+        :param tx_frame: Frame including CRC
+        :param rx_length: Receive length
+        :param parser: Function to convert the received frame to the result
+        :param priority: Scheduler priority when not configured for this board
+        :param relay: Relay number of single relay transactions
+        :param operation: Command or OPERATION_READ_STATUS of single relay transactions
+        :return: Result of parser
+        """
+        scheduler = self._modbus.scheduler
+
+        # The scheduler waits for the serial port when locked by this thread
+        if scheduler and not scheduler.is_worker_thread() and \
+                not self._modbus.is_locked_by_current_thread():
+            transaction = self._create_transaction(tx_frame, rx_length, parser, priority,
+                                                   relay=relay, operation=operation)
+            return scheduler.submit(transaction).result()
+
+        # Parse the received frame before another thread receives a frame
+        with self._modbus:
+            rx_frame = self._modbus.transfer_frame(tx_frame, False, rx_length)
+            return parser(rx_frame)
+
+    def _submit(self, tx_frame, rx_length, parser, priority, deadline, relay=None,
+                operation=None):
+        """
+            Queue frame in the scheduler without waiting for the response. The scheduler is
+            started when not running.
+        :param tx_frame: Frame including CRC
+        :param rx_length: Receive length
+        :param parser: Function to convert the received frame to the result
+        :param priority: Scheduler priority when not configured for this board
+        :param deadline: Deadline in seconds, None for the deadline of this board
+        :param relay: Relay number of single relay transactions
+        :param operation: Command or OPERATION_READ_STATUS of single relay transactions
+        :return: Future with the result of parser
+        """
+        if not self._modbus.is_open():
+            raise ModbusException('Error: Serial port not open')
+
+        transaction = self._create_transaction(tx_frame, rx_length, parser, priority, deadline,
+                                               relay, operation)
+        return relay_modbus.get_scheduler(self._modbus).submit(transaction)
+
     def _send_relay_command(self, relay, cmd, delay=0):
         """
             Send relay control
         :param relay: Relay number
         :param cmd: Command
         :param delay: Optional delay
-        :return: List response (int)
+        :return:
+            True: Command echoed by the relay board
+            False: Incorrect response
         """
 
         assert type(relay) == int
@@ -170,24 +753,76 @@ class R421A08(object):
         if not self._modbus.is_open():
             raise ModbusException('Error: Serial port not open')
 
-        # Create binary control command
-        tx_data = [
-            self._address,              # Slave address of the relay board 0..63
-            FUNCTION_CONTROL_COMMAND,   # Read status is always 0x03
-            0x00, relay,                # Relay 0x0001..0x0008
-            cmd,                        # Command 0x01..0x06
-            delay                       # Delay 0x00..0xFF
-        ]
+        tx_frame, parser = self._get_command(relay, cmd, delay)
 
-        # Send command
-        self._modbus.send(tx_data)
+        # Send command and wait for response with timeout, the parser updates the shadow state
+        try:
+            return self._transfer(tx_frame, RX_LEN_CONTROL_COMMAND, parser,
+                                  relay=relay, operation=cmd)
+        except Exception:
+            self.invalidate_cache(relay)
+            raise
 
-        # Wait for response with timeout
-        rx_frame = self._modbus.receive(RX_LEN_CONTROL_COMMAND)
+    def _send_relay_command_no_reply(self, relay, cmd, delay=0):
+        """
+            Send relay control without waiting for the response. The bus is reserved for the
+            response of the relay board.
+        :param relay: Relay number
+        :param cmd: Command
+        :param delay: Optional delay
+        :return: None
+        """
+        if not self._modbus.is_open():
+            raise ModbusException('Error: Serial port not open')
 
-        # Check response from relay
-        if not rx_frame or len(rx_frame) != RX_LEN_CONTROL_COMMAND:
-            return False
+        tx_frame, _ = get_control_frame(self._address, relay, cmd, delay)
+
+        # State is not confirmed by the relay board
+        self.invalidate_cache(relay)
+
+        scheduler = self._modbus.scheduler
+
+        if scheduler and not scheduler.is_worker_thread() and \
+                not self._modbus.is_locked_by_current_thread():
+            transaction = self._create_transaction(tx_frame, RX_LEN_CONTROL_COMMAND, None,
+                                                   relay_modbus.PRIORITY_CONTROL)
+            transaction.no_reply = True
+            scheduler.submit(transaction)
+        else:
+            with self._modbus:
+                self._modbus.send_frame(tx_frame, False, RX_LEN_CONTROL_COMMAND)
+
+    def _send_whole_board_command(self, relays, cmd, cmd_all):
+        """
+            Send relay command to all relays with one frame when possible
+        :param relays: List relays (int)
+        :param cmd: Command single relay
+        :param cmd_all: Command all relays
+        :return:
+            True: Command accepted by all relays
+            False: Command not accepted
+        """
+        relays = list(relays)
+
+        whole_board = sorted(set(relays)) == list(range(1, self._num_relays + 1))
+
+        if whole_board and self._whole_board.supported:
+            try:
+                accepted = self._send_relay_command(RELAY_ALL, cmd_all)
+            except (relay_modbus.TransferException, ModbusException) as err:
+                self._whole_board.failed(err)
+            else:
+                if accepted:
+                    self._whole_board.succeeded()
+                    return True
+                self._whole_board.failed()
+
+        for relay in relays:
+            if not self._send_relay_command(relay, cmd):
+                return False
+
+        if whole_board:
+            self._whole_board.fallback_succeeded()
 
         return True
 
@@ -206,55 +841,55 @@ class R421A08(object):
         if not self._modbus.is_open():
             raise ModbusException('Error: Serial port not open')
 
-        # Create binary read status
-        tx_data = [
-            self._address,          # Slave address of the relay board 0..63
-            FUNCTION_READ_STATUS,   # Read status is always 0x03
-            0x00, relay,            # Relay 0x0001..0x0008
-            0x00, 0x01              # Number of bytes is always 0x0001
-        ]
+        tx_frame, rx_prefix = get_status_frame(self._address, relay)
 
         # Send command and wait for response with timeout
-        self._modbus.send(tx_data)
-
-        # Wait for response with timeout
-        rx_data = self._modbus.receive(RX_LEN_READ_STATUS)
-
-        if rx_data and len(rx_data) > 2:
-            # Check CRC
-            data_no_crc = rx_data[:-2]
-            crc = rx_data[-2:]
-            if self._modbus.crc(data_no_crc) != crc:
-                raise ModbusException('RX error: Incorrect CRC received')
-            elif rx_data[0] != tx_data[0]:
-                raise ModbusException('RX error: Incorrect address received')
-            elif rx_data[1] != tx_data[1]:
-                raise ModbusException('RX error: Incorrect function received')
-            elif rx_data[2] != 2:
-                raise ModbusException('RX error: Incorrect data length received')
-            elif rx_data[3] != 0:
-                raise ModbusException('RX error: Incorrect data high Byte received')
-            elif rx_data[4] != 0 and rx_data[4] != 1:
-                raise ModbusException('RX error: Incorrect data low Byte received')
-            else:
-                return rx_data[4]
+        try:
+            status = self._transfer(tx_frame, RX_LEN_READ_STATUS,
+                                    partial(parse_status_response, rx_prefix),
+                                    relay_modbus.PRIORITY_BACKGROUND,
+                                    relay=relay, operation=OPERATION_READ_STATUS)
+        except Exception:
+            self.invalidate_cache(relay)
+            raise
 
-        return -1
+        self._set_shadow({relay: status})
 
-    # ----------------------------------------------------------------------------------------------
-    # Public functions to read/write single relay
-    # ----------------------------------------------------------------------------------------------
-    def get_status(self, relay):
-        return self._read_relay_status(relay)
+        return status
 
-    def print_status(self, relay, indent=False):
+    def _read_relay_status_all(self):
+        """
+            Read status all relays with one read status frame
+        :return: Dictionary with relay status {number: status, ...}
+        """
+
+        if not self._modbus.is_open():
+            raise ModbusException('Error: Serial port not open')
+
+        tx_frame, rx_prefix = get_status_frame(self._address, 1, self._num_relays)
+
+        # Send command and wait for response with timeout
+        try:
+            relay_status = self._transfer(tx_frame, get_status_length(self._num_relays),
+                                          partial(parse_status_all_response, rx_prefix,
+                                                  self._num_relays),
+                                          relay_modbus.PRIORITY_BACKGROUND)
+        except Exception:
+            self.invalidate_cache()
+            raise
+
+        self._set_shadow(relay_status)
+
+        return relay_status
+
+    @staticmethod
+    def _print_status(relay, status, indent=False):
         line = ''
         if indent:
             line += '  '
 
         line += 'Relay {}: '.format(relay)
 
-        status = self.get_status(relay)
         if status == 0:
             line += 'OFF'
         elif status == 1:
@@ -266,6 +901,23 @@ class R421A08(object):
         print(line)
         return True
 
+    # ----------------------------------------------------------------------------------------------
+    # Public functions to read/write single relay
+    # ----------------------------------------------------------------------------------------------
+    def get_status(self, relay):
+        relay_status = self._get_shadow([relay])
+        if relay_status is not None:
+            return relay_status[relay]
+
+        # Concurrent reads of the same relay share one transaction. A caller holding the bus lock
+        # reads itself, the executing read may wait for the lock.
+        return self._modbus.single_flight.do((self._address, OPERATION_READ_STATUS, relay),
+                                             self._read_relay_status, relay,
+                                             wait=not self._modbus.is_locked_by_current_thread())
+
+    def print_status(self, relay, indent=False):
+        return self._print_status(relay, self.get_status(relay), indent)
+
     def relay_poll(self, relay, interval=1.0):
         status_old = -1
         while 1:
@@ -285,6 +937,158 @@ class R421A08(object):
             if self._verbose:
                 print('.')
 
+    def submit_command(self, relay, cmd, delay=0, deadline=None):
+        """
+            Queue relay command in the scheduler without waiting for the response
+        :param relay: Relay number
+        :param cmd: CMD_ON, CMD_OFF, CMD_TOGGLE, CMD_LATCH, CMD_MOMENTARY or CMD_DELAY
+        :param delay: Delay in seconds for CMD_DELAY
+        :param deadline: Maximum time in seconds before the command must be transmitted,
+            default the deadline of this board
+        :return: Future with True when the command is echoed by the relay board. The future
+            fails with a relay_modbus.DeadlineException when the command was not transmitted
+            in time.
+        """
+        assert type(relay) == int
+        assert type(cmd) == int
+        assert type(delay) == int
+
+        tx_frame, parser = self._get_command(relay, cmd, delay)
+
+        future = self._submit(tx_frame, RX_LEN_CONTROL_COMMAND, parser,
+                              relay_modbus.PRIORITY_CONTROL, deadline, relay, cmd)
+        future.add_done_callback(partial(self._command_done, relay))
+
+        return future
+
+    def submit_status(self, relay, deadline=None):
+        """
+            Queue read relay status in the scheduler without waiting for the response
+        :param relay: Relay number
+        :param deadline: Maximum time in seconds before the read must be transmitted,
+            default the deadline of this board
+        :return: Future with the relay status (0 = off, 1 = on, -1 = unknown)
+        """
+        assert type(relay) == int
+
+        tx_frame, rx_prefix = get_status_frame(self._address, relay)
+
+        future = self._submit(tx_frame, RX_LEN_READ_STATUS,
+                              partial(parse_status_response, rx_prefix),
+                              relay_modbus.PRIORITY_BACKGROUND, deadline, relay,
+                              OPERATION_READ_STATUS)
+        future.add_done_callback(partial(self._status_done, relay))
+
+        return future
+
+    def submit_status_all(self, deadline=None):
+        """
+            Queue read status all relays in the scheduler without waiting for the response
+        :param deadline: Maximum time in seconds before the read must be transmitted,
+            default the deadline of this board
+        :return: Future with dictionary relay status {number: status, ...}
+        """
+        if self._status_all.supported:
+            tx_frame, rx_prefix = get_status_frame(self._address, 1, self._num_relays)
+            future = self._submit(tx_frame, get_status_length(self._num_relays),
+                                  partial(parse_status_all_response, rx_prefix,
+                                          self._num_relays),
+                                  relay_modbus.PRIORITY_BACKGROUND, deadline)
+        else:
+            relays = list(range(1, self._num_relays + 1))
+            future = relay_modbus.combine_futures(
+                [self.submit_status(relay, deadline) for relay in relays],
+                lambda results: dict(zip(relays, results)))
+        future.add_done_callback(self._status_all_done)
+
+        return future
+
+    def _status_all_done(self, future):
+        """
+            Update shadow state when a queued read status all relays is completed
+        :param future: Future of the read status
+        :return: None
+        """
+        if future.cancelled() or future.exception() is not None:
+            self.invalidate_cache()
+        else:
+            self._set_shadow(future.result())
+
+    # ----------------------------------------------------------------------------------------------
+    # Public functions returning a Future, completed by the scheduler thread
+    # ----------------------------------------------------------------------------------------------
+    def _submit_multi(self, relays, cmd, delay=0):
+        """
+            Queue relay command for multiple relays
+        :param relays: List relays (int)
+        :param cmd: Command
+        :param delay: Optional delay
+        :return: Future with True when all commands are accepted
+        """
+        return relay_modbus.combine_futures(
+            [self.submit_command(relay, cmd, delay) for relay in relays], all)
+
+    def get_status_async(self, relay):
+        relay_status = self._get_shadow([relay])
+        if relay_status is not None:
+            return _completed_future(relay_status[relay])
+        return self.submit_status(relay)
+
+    def get_status_multi_async(self, relays):
+        relays = list(relays)
+        if len(relays) > 1 and self._status_all.supported:
+            return relay_modbus.combine_futures(
+                [self.get_status_all_async()],
+                lambda results: dict((relay, results[0].get(relay, -1)) for relay in relays))
+        return relay_modbus.combine_futures([self.get_status_async(relay) for relay in relays],
+                                            lambda results: dict(zip(relays, results)))
+
+    def get_status_all_async(self):
+        relay_status = self._get_shadow(range(1, self._num_relays + 1))
+        if relay_status is not None:
+            return _completed_future(relay_status)
+        return self.submit_status_all()
+
+    def on_async(self, relay):
+        return self.submit_command(relay, CMD_ON)
+
+    def off_async(self, relay):
+        return self.submit_command(relay, CMD_OFF)
+
+    def toggle_async(self, relay):
+        return self.submit_command(relay, CMD_TOGGLE)
+
+    def latch_async(self, relay):
+        return self.submit_command(relay, CMD_LATCH)
+
+    def momentary_async(self, relay):
+        return self.submit_command(relay, CMD_MOMENTARY)
+
+    def delay_async(self, relay, delay):
+        return self.submit_command(relay, CMD_DELAY, delay)
+
+    def on_multi_async(self, relays):
+        return self._submit_multi(relays, CMD_ON)
+
+    def off_multi_async(self, relays):
+        return self._submit_multi(relays, CMD_OFF)
+
+    def toggle_multi_async(self, relays):
+        return self._submit_multi(relays, CMD_TOGGLE)
+
+    def on_all_async(self):
+        if self._whole_board.supported:
+            return self.submit_command(RELAY_ALL, CMD_ON_ALL)
+        return self._submit_multi(range(1, self._num_relays + 1), CMD_ON)
+
+    def off_all_async(self):
+        if self._whole_board.supported:
+            return self.submit_command(RELAY_ALL, CMD_OFF_ALL)
+        return self._submit_multi(range(1, self._num_relays + 1), CMD_OFF)
+
+    def toggle_all_async(self):
+        return self._submit_multi(range(1, self._num_relays + 1), CMD_TOGGLE)
+
     def on(self, relay):
         return self._send_relay_command(relay, CMD_ON)
 
@@ -312,6 +1116,13 @@ class R421A08(object):
         :param relays: List relays (int)
         :return: Dictionary with relay status [(number: status}, ...]
         """
+        relays = list(relays)
+
+        if len(relays) > 1 and self._status_all.supported:
+            # Reading all relays with one frame is faster than reading two or more relays
+            status_all = self.get_status_all()
+            return {relay: status_all.get(relay, -1) for relay in relays}
+
         relay_status = {}
 
         for relay in relays:
@@ -327,8 +1138,10 @@ class R421A08(object):
         :param indent: True: Add spaces at the beginning of the line
         :return: None
         """
+        relay_status = self.get_status_multi(relays)
+
         for relay in relays:
-            if not self.print_status(relay, indent):
+            if not self._print_status(relay, relay_status[relay], indent):
                 return False
         return True
 
@@ -336,18 +1149,10 @@ class R421A08(object):
     #     print_stderr('TODO: Not implement yet')
 
     def on_multi(self, relays):
-        for relay in relays:
-            retval = self.on(relay)
-            if not retval:
-                return False
-        return True
+        return self._send_whole_board_command(relays, CMD_ON, CMD_ON_ALL)
 
     def off_multi(self, relays):
-        for relay in relays:
-            retval = self.off(relay)
-            if not retval:
-                return False
-        return True
+        return self._send_whole_board_command(relays, CMD_OFF, CMD_OFF_ALL)
 
     def toggle_multi(self, relays):
         for relay in relays:
@@ -381,7 +1186,59 @@ class R421A08(object):
     # Public functions to read/write all relays
     # ----------------------------------------------------------------------------------------------
     def get_status_all(self):
-        return self.get_status_multi(range(1, self._num_relays + 1))
+        """
+            Read status all relays with one transaction, or one transaction per relay when the
+            board does not answer the read status all frame. Concurrent calls for the same board
+            share one read.
+        :return: Dictionary with relay status {number: status, ...}
+        """
+        relay_status = self._get_shadow(range(1, self._num_relays + 1))
+        if relay_status is not None:
+            return relay_status
+
+        # Concurrent reads of the same board share one read, each caller gets a copy. A caller
+        # holding the bus lock reads itself, the executing read may wait for the lock.
+        relay_status = self._modbus.single_flight.do(
+            (self._address, OPERATION_READ_STATUS, RELAY_ALL), self._get_status_all,
+            wait=not self._modbus.is_locked_by_current_thread())
+        return dict(relay_status)
+
+    def _get_status_all(self):
+        """
+            Read status all relays
+        :return: Dictionary with relay status {number: status, ...}
+        """
+        if self._status_all.supported:
+            try:
+                relay_status = self._read_relay_status_all()
+            except (relay_modbus.TransferException, ModbusException) as err:
+                self._status_all.failed(err)
+            else:
+                self._status_all.succeeded()
+                return relay_status
+
+        relay_status = {}
+        for relay in range(1, self._num_relays + 1):
+            relay_status[relay] = self._read_relay_status(relay)
+
+        self._status_all.fallback_succeeded()
+
+        return relay_status
+
+    def get_status_mask(self):
+        """
+            Read status all relays as bitmask
+        :return: Bitmask with bit 0 relay 1 .. bit 7 relay 8, or -1 when an error occurred
+        """
+        mask = 0
+
+        for relay, status in self.get_status_all().items():
+            if status < 0:
+                return -1
+            elif status:
+                mask |= 1 << (relay - 1)
+
+        return mask
 
     def print_status_all(self, indent=False):
         return self.print_status_multi(range(1, self._num_relays + 1), indent=indent)
@@ -403,3 +1260,434 @@ class R421A08(object):
 
     def delay_all(self, delay):
         return self.delay_multi(range(1, self._num_relays + 1), delay=delay)
+
+    def on_all_no_reply(self):
+        """
+            Turn all relays on without waiting for the response
+        :return: None
+        """
+        if self._whole_board.supported:
+            self._send_relay_command_no_reply(RELAY_ALL, CMD_ON_ALL)
+        else:
+            for relay in range(1, self._num_relays + 1):
+                self._send_relay_command_no_reply(relay, CMD_ON)
+
+    def off_all_no_reply(self):
+        """
+            Turn all relays off without waiting for the response
+        :return: None
+        """
+        if self._whole_board.supported:
+            self._send_relay_command_no_reply(RELAY_ALL, CMD_OFF_ALL)
+        else:
+            for relay in range(1, self._num_relays + 1):
+                self._send_relay_command_no_reply(relay, CMD_OFF)
+
+    # ----------------------------------------------------------------------------------------------
+    # Public functions to apply a desired state
+    # ----------------------------------------------------------------------------------------------
+    def _get_changes(self, desired, current):
+        """
+            Get relays with a different desired state
+        :param desired: Dictionary with desired relay status {number: status, ...}
+        :param current: Dictionary with current relay status {number: status, ...}
+        :return: Dictionary with relay status to send {number: status, ...}
+        """
+        return dict((relay, status) for relay, status in desired.items()
+                    if current.get(relay) != status)
+
+    def _apply_changes(self, desired, changes):
+        """
+            Send changed relay states with the minimum number of frames
+        :param desired: Dictionary with desired relay status {number: status, ...}
+        :param changes: Dictionary with relay status to send {number: status, ...}
+        :return:
+            True: Commands accepted by all relays
+            False: Command not accepted
+        """
+        return all(self._send_changes(desired, changes, {}).values())
+
+    def _send_changes(self, desired, changes, results):
+        """
+            Send changed relay states with the minimum number of frames
+        :param desired: Dictionary with desired relay status {number: status, ...}
+        :param changes: Dictionary with relay status to send {number: status, ...}
+        :param results: Dictionary filled with the result of the frame per relay
+            {number: True when accepted, ...}, also when a frame raises an exception
+        :return: results
+        """
+        all_relays = list(range(1, self._num_relays + 1))
+        on_relays = [relay for relay, status in desired.items() if status]
+
+        if len(changes) > 1 and sorted(desired) == all_relays:
+            # One frame is cheaper than a frame per changed relay
+            if len(on_relays) == self._num_relays and self._whole_board.supported:
+                result = self._send_whole_board_command(all_relays, CMD_ON, CMD_ON_ALL)
+            elif not on_relays and self._whole_board.supported:
+                result = self._send_whole_board_command(all_relays, CMD_OFF, CMD_OFF_ALL)
+            elif len(on_relays) == 1:
+                result = self._send_relay_command(on_relays[0], CMD_LATCH)
+            else:
+                result = None
+
+            if result is not None:
+                for relay in all_relays:
+                    results[relay] = result
+                return results
+
+        for relay, status in sorted(changes.items()):
+            if status:
+                cmd = CMD_ON
+            else:
+                cmd = CMD_OFF
+            results[relay] = self._send_relay_command(relay, cmd)
+
+        return results
+
+    def _get_desired_mask(self, mask):
+        """
+            Convert bitmask to desired relay status
+        :param mask: Bitmask with bit 0 relay 1 .. bit 7 relay 8
+        :return: Dictionary with relay status {number: status, ...}
+        """
+        assert type(mask) == int
+        assert 0 <= mask < (1 << self._num_relays)
+
+        return dict((relay, (mask >> (relay - 1)) & 1) for relay in range(1, self._num_relays + 1))
+
+    def apply(self, mask):
+        """
+            Set all relays to a bitmask. Only relays with a different state are switched, using
+            the shadow state or one read status when the state is unknown.
+        :param mask: Bitmask with bit 0 relay 1 .. bit 7 relay 8
+        :return:
+            True: Relay states applied
+            False: Command not accepted
+        """
+        desired = self._get_desired_mask(mask)
+
+        return self._apply_changes(desired, self._get_changes(desired, self.get_status_all()))
+
+    def apply_dict(self, relay_status):
+        """
+            Set relays to a state, other relays keep their state. Only relays with a different
+            state are switched.
+        :param relay_status: Dictionary with relay status {number: status, ...}
+        :return:
+            True: Relay states applied
+            False: Command not accepted
+        """
+        assert type(relay_status) == dict
+
+        current = self.get_status_all()
+
+        # Relays with an unknown state are switched only when specified
+        desired = dict((relay, status) for relay, status in current.items() if status in (0, 1))
+        for relay, status in relay_status.items():
+            assert 1 <= relay <= self._num_relays
+            desired[relay] = 1 if status else 0
+
+        return self._apply_changes(desired, self._get_changes(desired, current))
+
+    def apply_poll(self, mask, interval=1.0):
+        """
+            Set all relays to a bitmask and read the relay states periodically. Relay states
+            are applied again when changed, for example after a power cycle of the board.
+        :param mask: Bitmask with bit 0 relay 1 .. bit 7 relay 8
+        :param interval: Time in seconds between reading the relay states
+        :return: None
+        """
+        desired = self._get_desired_mask(mask)
+        applied = False
+
+        while 1:
+            # Verify the board, not the shadow state
+            self.invalidate_cache()
+            changes = self._get_changes(desired, self.get_status_all())
+
+            if changes:
+                if applied:
+                    print('Relay board {}: {} relay(s) changed, applying again'.format(
+                        self._address, len(changes)))
+                if not self._apply_changes(desired, changes):
+                    print('Relay board {}: Apply failed'.format(self._address))
+            applied = True
+
+            time.sleep(interval)
+            if self._verbose:
+                print('.')
+
+    # ----------------------------------------------------------------------------------------------
+    # Public functions to collect relay commands in a batch
+    # ----------------------------------------------------------------------------------------------
+    def batch(self, batch=None, raise_exception=True):
+        """
+            Create batch to collect relay commands, executed in one pass when leaving the with
+            block:
+                with board.batch() as batch:
+                    batch.on(1)
+                    batch.off(3)
+        :param batch: Optional relay_modbus.Batch object shared with other relay boards,
+            see relay_modbus.Modbus.batch()
+        :param raise_exception: Raise the first command exception when leaving the with block,
+            used when batch is None
+        :return: R421A08Batch object
+        """
+        if batch is None:
+            batch = relay_modbus.Batch(self._modbus, raise_exception)
+
+        return R421A08Batch(self, batch)
+
+    def _flush_batch_segment(self, state, operations):
+        """
+            Send final state of on/off/toggle/latch operations
+        :param state: Dictionary {relay: (toggle, value), ...}: Relay state when toggle is False,
+            toggle parity when toggle is True
+        :param operations: List BatchOperation objects completed with the result of the frames
+            carrying their relays
+        :return: None
+        """
+        if not operations:
+            return
+
+        desired = dict((relay, value) for relay, (toggle, value) in state.items() if not toggle)
+        toggles = dict((relay, value) for relay, (toggle, value) in state.items() if toggle)
+
+        # Relays without a frame, such as a known state or two toggles, are accepted
+        results = dict((relay, True) for relay in state)
+        error = None
+        try:
+            if desired:
+                # Skip relays with a known state in the shadow state
+                current = {}
+                for relay in sorted(desired):
+                    current.update(self._get_shadow([relay]) or {})
+                changes = self._get_changes(desired, current)
+                for relay in changes:
+                    del results[relay]
+                if changes:
+                    self._send_changes(desired, changes, results)
+
+            for relay in sorted(relay for relay, value in toggles.items() if value):
+                del results[relay]
+                results[relay] = self._send_relay_command(relay, CMD_TOGGLE)
+        except Exception as err:
+            error = err
+
+        for operation in operations:
+            if operation.name == CMD_LATCH:
+                relays = range(1, self._num_relays + 1)
+            else:
+                relays = operation.args[0]
+
+            if all(relay in results for relay in relays):
+                operation.set_result(all(results[relay] for relay in relays))
+            else:
+                # Frame of a relay of this operation raised an exception or was not sent
+                operation.set_exception(error)
+
+    def flush_batch(self, operations):
+        """
+            Execute batch operations of this board, called by relay_modbus.Batch.flush().
+            Redundant operations are merged and all relays are switched with a whole-board or
+            latch frame when possible. Momentary and delay operations are executed in order.
+        :param operations: List BatchOperation objects with a command and arguments
+            (relays, delay)
+        :return: None
+        """
+        # Keep the bus for all operations of this board
+        with self._modbus:
+            self._flush_batch(operations)
+
+    def _flush_batch(self, operations):
+        """
+            Execute batch operations of this board with the serial port locked
+        :param operations: List BatchOperation objects
+        :return: None
+        """
+        state = {}
+        segment = []
+
+        for operation in operations:
+            cmd = operation.name
+            relays, delay = operation.args
+
+            if cmd in (CMD_MOMENTARY, CMD_DELAY):
+                # Timed commands can not be merged
+                self._flush_batch_segment(state, segment)
+                state = {}
+                segment = []
+                try:
+                    result = True
+                    for relay in relays:
+                        if not self._send_relay_command(relay, cmd, delay):
+                            result = False
+                except Exception as err:
+                    operation.set_exception(err)
+                else:
+                    operation.set_result(result)
+                continue
+
+            segment.append(operation)
+            for relay in relays:
+                if cmd == CMD_ON:
+                    state[relay] = (False, 1)
+                elif cmd == CMD_OFF:
+                    state[relay] = (False, 0)
+                elif cmd == CMD_TOGGLE:
+                    # Toggle a set state or the toggle parity
+                    toggle, value = state.get(relay, (True, 0))
+                    state[relay] = (toggle, 1 - value)
+                elif cmd == CMD_LATCH:
+                    state = dict((number, (False, 0)) for number in range(1, self._num_relays + 1))
+                    state[relay] = (False, 1)
+
+        self._flush_batch_segment(state, segment)
+
+
+class R421A08Batch(object):
+    """ Relay commands of one R421A08 relay board recorded in a batch """
+
+    def __init__(self, board, batch):
+        """
+            R421A08Batch constructor
+        :param board: R421A08 object
+        :param batch: relay_modbus.Batch object
+        """
+        self._board = board
+        self._batch = batch
+
+    @property
+    def batch(self):
+        return self._batch
+
+    def _add(self, cmd, relays, delay=0):
+        relays = list(relays)
+        for relay in relays:
+            assert type(relay) == int
+            assert 1 <= relay <= self._board.num_relays
+
+        return self._batch.add(self._board, cmd, relays, delay)
+
+    def on(self, relay):
+        return self._add(CMD_ON, [relay])
+
+    def off(self, relay):
+        return self._add(CMD_OFF, [relay])
+
+    def toggle(self, relay):
+        return self._add(CMD_TOGGLE, [relay])
+
+    def latch(self, relay):
+        return self._add(CMD_LATCH, [relay])
+
+    def momentary(self, relay):
+        return self._add(CMD_MOMENTARY, [relay])
+
+    def delay(self, relay, delay):
+        assert type(delay) == int
+        return self._add(CMD_DELAY, [relay], delay)
+
+    def on_multi(self, relays):
+        return self._add(CMD_ON, relays)
+
+    def off_multi(self, relays):
+        return self._add(CMD_OFF, relays)
+
+    def toggle_multi(self, relays):
+        return self._add(CMD_TOGGLE, relays)
+
+    def on_all(self):
+        return self._add(CMD_ON, range(1, self._board.num_relays + 1))
+
+    def off_all(self):
+        return self._add(CMD_OFF, range(1, self._board.num_relays + 1))
+
+    def toggle_all(self):
+        return self._add(CMD_TOGGLE, range(1, self._board.num_relays + 1))
+
+    def flush(self):
+        return self._batch.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._batch.__exit__(exc_type, exc_value, traceback)
+
+
+def _switch_all_boards(boards, status, verify):
+    """
+        Turn all relays of multiple boards on or off. The bus is still reserved for the responses
+        which are not received, so this takes about as long as confirmed commands per board. It
+        does not wait for the receive timeout of boards which do not answer.
+        The reservation assumes each board starts its response within the delay between frames
+        (t3.5 + turnaround delay of the Modbus object) plus Modbus.reply_delay. Increase
+        Modbus.reply_delay for slower boards, otherwise the next frame may collide with a late
+        response.
+    :param boards: List R421A08 objects
+    :param status: 0 = off, 1 = on
+    :param verify: Read status of all boards afterwards and retry boards with a different state
+    :return:
+        True: Frames transmitted, or verified when verify is True
+        False: Verification failed
+    """
+    boards = list(boards)
+
+    # Transmit one frame per board without waiting for the responses
+    for board in boards:
+        if status:
+            board.on_all_no_reply()
+        else:
+            board.off_all_no_reply()
+
+    if not verify:
+        return True
+
+    # Verification sweep: Retry boards which did not switch with a confirmed command
+    success = True
+    mask = ((1 << NUM_RELAYS) - 1) if status else 0
+    for board in boards:
+        try:
+            if board.get_status_mask() == mask & ((1 << board.num_relays) - 1):
+                continue
+
+            if status:
+                accepted = board.on_all()
+            else:
+                accepted = board.off_all()
+        except (relay_modbus.TransferException, ModbusException):
+            # Board does not answer: Verify remaining boards
+            accepted = False
+
+        if not accepted:
+            success = False
+
+    return success
+
+
+def on_all_boards(boards, verify=False):
+    """
+        Turn all relays of multiple boards on with one frame per board
+    :param boards: List R421A08 objects
+    :param verify: Read status of all boards afterwards and retry boards which did not switch
+        The bus is reserved for the responses which are not received, see Modbus.reply_delay.
+    :return:
+        True: Frames transmitted, or verified when verify is True
+        False: Verification failed
+    """
+    return _switch_all_boards(boards, 1, verify)
+
+
+def off_all_boards(boards, verify=False):
+    """
+        Turn all relays of multiple boards off with one frame per board, for example an
+        emergency off
+    :param boards: List R421A08 objects
+    :param verify: Read status of all boards afterwards and retry boards which did not switch
+        The bus is reserved for the responses which are not received, see Modbus.reply_delay.
+    :return:
+        True: Frames transmitted, or verified when verify is True
+        False: Verification failed
+    """
+    return _switch_all_boards(boards, 0, verify)
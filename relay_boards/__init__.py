@@ -1,4 +1,5 @@
-from . R421A08 import R421A08, ModbusException
+from . R421A08 import R421A08, R421A08Batch, ModbusException, on_all_boards, off_all_boards
+from . bus_executor import BusExecutor
 
 __version__ = '1.0.1'
 VERSION = __version__
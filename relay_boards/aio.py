@@ -0,0 +1,348 @@
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+##
+# This module controls R421A08 relay boards with asyncio
+#
+# Source: https://github.com/Erriez/R421A08-rs485-8ch-relay-board
+#
+
+import relay_modbus
+from relay_modbus.aio import AsyncModbus
+
+from . R421A08 import ModbusException, BOARD_TYPE, NUM_ADDRESSES, NUM_RELAYS
+from . R421A08 import CMD_ON, CMD_OFF, CMD_TOGGLE, CMD_LATCH, CMD_MOMENTARY, CMD_DELAY
+from . R421A08 import CMD_ON_ALL, CMD_OFF_ALL, RELAY_ALL
+from . R421A08 import RX_LEN_CONTROL_COMMAND, RX_LEN_READ_STATUS, FrameSupport
+from . R421A08 import get_control_frame, get_status_frame, get_status_length
+from . R421A08 import parse_control_response, parse_status_response, parse_status_all_response
+
+
+class AsyncR421A08(object):
+    """ R421A08 relay board class with coroutines, mirrors the R421A08 class """
+    def __init__(self,
+                 modbus_obj,
+                 address=1,
+                 board_name='Relay board {}'.format(BOARD_TYPE),
+                 num_address=NUM_ADDRESSES,
+                 num_relays=NUM_RELAYS,
+                 whole_board_commands=True,
+                 verbose=False):
+        """
+            AsyncR421A08 relay board constructor
+        :param modbus_obj: AsyncModbus object
+        :param address:
+        :param board_name:
+        :param num_address:
+        :param num_relays:
+        :param whole_board_commands:
+            True: Turn all relays on/off with one frame (Default)
+            False: Turn all relays on/off with one frame per relay
+        :param verbose:
+            False: Normal prints (Default)
+            True: Print verbose messages
+        """
+        self._verbose = verbose
+
+        assert type(modbus_obj) == AsyncModbus
+        self._modbus = modbus_obj
+
+        assert 0 <= int(address) < NUM_ADDRESSES
+        self._address = int(address)
+
+        self._board_name = str(board_name)
+        self._num_addresses = int(num_address)
+        self._num_relays = int(num_relays)
+
+        # Read status all relays with a single frame
+        self._status_all = FrameSupport()
+
+        # Turn all relays on/off with a single frame
+        self._whole_board = FrameSupport(whole_board_commands)
+
+    # ----------------------------------------------------------------------------------------------
+    # Relay board properties
+    # ----------------------------------------------------------------------------------------------
+    @property
+    def board_type(self):
+        return BOARD_TYPE
+
+    @property
+    def board_name(self):
+        return self._board_name
+
+    @board_name.setter
+    def board_name(self, board_name):
+        self._board_name = board_name
+
+    @property
+    def serial_port(self):
+        return self._modbus.serial_port
+
+    @property
+    def baudrate(self):
+        return self._modbus.baudrate
+
+    @property
+    def address(self):
+        return self._address
+
+    @address.setter
+    def address(self, address):
+        address = int(address)
+
+        if address >= 0 and address < self._num_addresses:
+            self._address = address
+
+    @property
+    def num_addresses(self):
+        return self._num_addresses
+
+    @property
+    def num_relays(self):
+        return self._num_relays
+
+    @property
+    def status_all_supported(self):
+        return self._status_all.supported
+
+    @property
+    def whole_board_supported(self):
+        return self._whole_board.supported
+
+    # ----------------------------------------------------------------------------------------------
+    # Relay board private functions
+    # ----------------------------------------------------------------------------------------------
+    async def _send_relay_command(self, relay, cmd, delay=0):
+        """
+            Send relay control
+        :param relay: Relay number
+        :param cmd: Command
+        :param delay: Optional delay
+        :return:
+            True: Command echoed by the relay board
+            False: Incorrect response
+        """
+        assert type(relay) == int
+        assert type(cmd) == int
+        assert type(delay) == int
+
+        if not self._modbus.is_open():
+            raise ModbusException('Error: Serial port not open')
+
+        tx_frame, rx_expected = get_control_frame(self._address, relay, cmd, delay)
+
+        rx_frame = await self._modbus.transfer_frame(tx_frame, False, RX_LEN_CONTROL_COMMAND)
+        return parse_control_response(rx_expected, rx_frame)
+
+    async def _send_whole_board_command(self, relays, cmd, cmd_all):
+        """
+            Send relay command to all relays with one frame when possible
+        :param relays: List relays (int)
+        :param cmd: Command single relay
+        :param cmd_all: Command all relays
+        :return:
+            True: Command accepted by all relays
+            False: Command not accepted
+        """
+        relays = list(relays)
+
+        whole_board = sorted(set(relays)) == list(range(1, self._num_relays + 1))
+
+        if whole_board and self._whole_board.supported:
+            try:
+                accepted = await self._send_relay_command(RELAY_ALL, cmd_all)
+            except (relay_modbus.TransferException, ModbusException) as err:
+                self._whole_board.failed(err)
+            else:
+                if accepted:
+                    self._whole_board.succeeded()
+                    return True
+                self._whole_board.failed()
+
+        for relay in relays:
+            if not await self._send_relay_command(relay, cmd):
+                return False
+
+        if whole_board:
+            self._whole_board.fallback_succeeded()
+
+        return True
+
+    async def _read_relay_status(self, relay):
+        """
+            Read relay status
+        :param relay: Relay number
+        :return:
+            0: Relay off
+            1: Relay on
+            -1: An error occurred
+        """
+        assert type(relay) == int
+
+        if not self._modbus.is_open():
+            raise ModbusException('Error: Serial port not open')
+
+        tx_frame, rx_prefix = get_status_frame(self._address, relay)
+
+        rx_frame = await self._modbus.transfer_frame(tx_frame, False, RX_LEN_READ_STATUS)
+        return parse_status_response(rx_prefix, rx_frame)
+
+    async def _read_relay_status_all(self):
+        """
+            Read status all relays with one read status frame
+        :return: Dictionary with relay status {number: status, ...}
+        """
+        if not self._modbus.is_open():
+            raise ModbusException('Error: Serial port not open')
+
+        tx_frame, rx_prefix = get_status_frame(self._address, 1, self._num_relays)
+
+        rx_frame = await self._modbus.transfer_frame(tx_frame, False,
+                                                     get_status_length(self._num_relays))
+        return parse_status_all_response(rx_prefix, self._num_relays, rx_frame)
+
+    async def _send_multi(self, relays, cmd, delay=0):
+        for relay in relays:
+            if not await self._send_relay_command(relay, cmd, delay):
+                return False
+        return True
+
+    # ----------------------------------------------------------------------------------------------
+    # Public functions to read/write single relay
+    # ----------------------------------------------------------------------------------------------
+    async def get_status(self, relay):
+        return await self._read_relay_status(relay)
+
+    async def on(self, relay):
+        return await self._send_relay_command(relay, CMD_ON)
+
+    async def off(self, relay):
+        return await self._send_relay_command(relay, CMD_OFF)
+
+    async def toggle(self, relay):
+        return await self._send_relay_command(relay, CMD_TOGGLE)
+
+    async def latch(self, relay):
+        return await self._send_relay_command(relay, CMD_LATCH)
+
+    async def momentary(self, relay):
+        return await self._send_relay_command(relay, CMD_MOMENTARY)
+
+    async def delay(self, relay, delay):
+        return await self._send_relay_command(relay, CMD_DELAY, delay)
+
+    # ----------------------------------------------------------------------------------------------
+    # Public functions to read/write multiple relays
+    # ----------------------------------------------------------------------------------------------
+    async def get_status_multi(self, relays):
+        relays = list(relays)
+
+        if len(relays) > 1 and self._status_all.supported:
+            # Reading all relays with one frame is faster than reading two or more relays
+            status_all = await self.get_status_all()
+            return {relay: status_all.get(relay, -1) for relay in relays}
+
+        relay_status = {}
+        for relay in relays:
+            relay_status[relay] = await self._read_relay_status(relay)
+
+        return relay_status
+
+    async def on_multi(self, relays):
+        return await self._send_whole_board_command(relays, CMD_ON, CMD_ON_ALL)
+
+    async def off_multi(self, relays):
+        return await self._send_whole_board_command(relays, CMD_OFF, CMD_OFF_ALL)
+
+    async def toggle_multi(self, relays):
+        return await self._send_multi(relays, CMD_TOGGLE)
+
+    async def latch_multi(self, relays):
+        return await self._send_multi(relays, CMD_LATCH)
+
+    async def momentary_multi(self, relays):
+        return await self._send_multi(relays, CMD_MOMENTARY)
+
+    async def delay_multi(self, relays, delay):
+        return await self._send_multi(relays, CMD_DELAY, delay)
+
+    # ----------------------------------------------------------------------------------------------
+    # Public functions to read/write all relays
+    # ----------------------------------------------------------------------------------------------
+    async def get_status_all(self):
+        """
+            Read status all relays with one transaction, or one transaction per relay when the
+            board does not answer the read status all frame
+        :return: Dictionary with relay status {number: status, ...}
+        """
+        if self._status_all.supported:
+            try:
+                relay_status = await self._read_relay_status_all()
+            except (relay_modbus.TransferException, ModbusException) as err:
+                self._status_all.failed(err)
+            else:
+                self._status_all.succeeded()
+                return relay_status
+
+        relay_status = {}
+        for relay in range(1, self._num_relays + 1):
+            relay_status[relay] = await self._read_relay_status(relay)
+
+        self._status_all.fallback_succeeded()
+
+        return relay_status
+
+    async def get_status_mask(self):
+        """
+            Read status all relays as bitmask
+        :return: Bitmask with bit 0 relay 1 .. bit 7 relay 8, or -1 when an error occurred
+        """
+        mask = 0
+
+        for relay, status in (await self.get_status_all()).items():
+            if status < 0:
+                return -1
+            elif status:
+                mask |= 1 << (relay - 1)
+
+        return mask
+
+    async def on_all(self):
+        return await self.on_multi(range(1, self._num_relays + 1))
+
+    async def off_all(self):
+        return await self.off_multi(range(1, self._num_relays + 1))
+
+    async def toggle_all(self):
+        return await self.toggle_multi(range(1, self._num_relays + 1))
+
+    async def latch_all(self):
+        return await self.latch_multi(range(1, self._num_relays + 1))
+
+    async def momentary_all(self):
+        return await self.momentary_multi(range(1, self._num_relays + 1))
+
+    async def delay_all(self, delay):
+        return await self.delay_multi(range(1, self._num_relays + 1), delay=delay)
@@ -0,0 +1,176 @@
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+##
+# This module runs work on relay boards of multiple RS485 buses concurrently
+#
+# Source: https://github.com/Erriez/R421A08-rs485-8ch-relay-board
+#
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from . R421A08 import on_all_boards, off_all_boards
+
+
+class BusExecutor(object):
+    """ One worker thread per serial port to drive independent RS485 buses concurrently """
+
+    def __init__(self, boards=None):
+        """
+            BusExecutor constructor
+        :param boards: Optional list with R421A08 objects
+        """
+        self._lock = threading.Lock()
+
+        # Boards and worker by serial port
+        self._boards = {}
+        self._workers = {}
+
+        if boards is not None:
+            for board in boards:
+                self.add_board(board)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    @property
+    def serial_ports(self):
+        with self._lock:
+            return list(self._boards)
+
+    @property
+    def boards(self):
+        with self._lock:
+            return [board for boards in self._boards.values() for board in boards]
+
+    def add_board(self, board):
+        """
+            Add relay board to the worker of its serial port
+        :param board: R421A08 object
+        :return: None
+        """
+        with self._lock:
+            serial_port = board.serial_port
+            if serial_port not in self._boards:
+                self._boards[serial_port] = []
+                self._workers[serial_port] = ThreadPoolExecutor(max_workers=1)
+            if board not in self._boards[serial_port]:
+                self._boards[serial_port].append(board)
+
+    def shutdown(self, wait_done=True):
+        """
+            Stop all workers
+        :param wait_done: Wait until running work is completed
+        :return: None
+        """
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+            self._boards.clear()
+
+        for worker in workers:
+            worker.shutdown(wait=wait_done)
+
+    def submit(self, function, *args):
+        """
+            Call function(boards, *args) once per bus with the boards of that bus, all buses
+            concurrently
+        :param function: Function with a list of R421A08 objects of one bus as first argument
+        :param args: Additional function arguments
+        :return: Dictionary with futures {serial_port: Future, ...}
+        """
+        with self._lock:
+            return {serial_port: self._workers[serial_port].submit(function, list(boards), *args)
+                    for serial_port, boards in self._boards.items()}
+
+    def run(self, function, *args):
+        """
+            Call function(boards, *args) once per bus concurrently and wait for all buses
+        :param function: Function with a list of R421A08 objects of one bus as first argument
+        :param args: Additional function arguments
+        :return: Dictionary with results {serial_port: result, ...}
+        :raise: First exception of a bus after all buses completed
+        """
+        futures = self.submit(function, *args)
+        wait(futures.values())
+
+        # Raise exception only after all buses completed, no bus is left half way
+        return {serial_port: future.result() for serial_port, future in futures.items()}
+
+    def run_boards(self, function, *args):
+        """
+            Call function(board, *args) for every board, boards of one bus in order and all
+            buses concurrently
+        :param function: Function with an R421A08 object as first argument
+        :param args: Additional function arguments
+        :return: Dictionary with results {(serial_port, address): result, ...}
+        :raise: First exception of a bus after all buses completed
+        """
+        def run_bus(boards):
+            return [(board.address, function(board, *args)) for board in boards]
+
+        results = {}
+        for serial_port, bus_results in self.run(run_bus).items():
+            for address, result in bus_results:
+                results[(serial_port, address)] = result
+
+        return results
+
+    def get_status_all(self):
+        """
+            Read status of all relays of all boards
+        :return: Dictionary with relay status {(serial_port, address): {number: status, ...}, ...}
+        """
+        return self.run_boards(lambda board: board.get_status_all())
+
+    def get_status_mask(self):
+        """
+            Read relay bitmask of all boards
+        :return: Dictionary with relay bitmasks {(serial_port, address): mask, ...}
+        """
+        return self.run_boards(lambda board: board.get_status_mask())
+
+    def on_all(self, verify=False):
+        """
+            Turn all relays of all boards on
+        :param verify: Read status of all boards afterwards and retry boards which did not switch
+        :return:
+            True: Frames transmitted, or verified when verify is True
+            False: Verification failed on one or more buses
+        """
+        return all(self.run(on_all_boards, verify).values())
+
+    def off_all(self, verify=False):
+        """
+            Turn all relays of all boards off, for example an emergency off
+        :param verify: Read status of all boards afterwards and retry boards which did not switch
+        :return:
+            True: Frames transmitted, or verified when verify is True
+            False: Verification failed on one or more buses
+        """
+        return all(self.run(off_all_boards, verify).values())
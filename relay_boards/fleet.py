@@ -0,0 +1,368 @@
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+##
+# This module stores the desired and observed relay states of a fleet of R421A08 relay boards
+#
+# Source: https://github.com/Erriez/R421A08-rs485-8ch-relay-board
+#
+
+import sys
+
+from print_stderr import print_stderr
+
+try:
+    import numpy as np
+except ImportError:
+    print_stderr('Error: Cannot import numpy.')
+    if sys.platform.startswith('linux'):
+        print_stderr('To install numpy, type:')
+        if sys.version_info[0] >= 3:
+            print_stderr('  sudo apt-get install python3-pip')
+            print_stderr('  sudo pip3 install numpy')
+        else:
+            print_stderr('  sudo python -m pip install numpy')
+    elif sys.platform.startswith('win'):
+        print_stderr('To install numpy, type:')
+        print_stderr('  python.exe -m pip install numpy')
+    else:
+        print_stderr('Install numpy manually')
+    sys.exit(1)
+
+from . R421A08 import R421A08, NUM_RELAYS, RELAY_ALL
+from . R421A08 import CMD_ON, CMD_OFF, CMD_LATCH, CMD_ON_ALL, CMD_OFF_ALL
+
+
+# Number of relays set in a Byte
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+# Relay number of the lowest bit set in a Byte, 0 when no bit set
+_LOWEST_RELAY = np.array([(value & -value).bit_length() for value in range(256)], dtype=np.uint8)
+
+
+class Fleet(object):
+    """ Relay states of many relay boards, one Byte per board with bit 0 relay 1 """
+
+    def __init__(self, num_relays=NUM_RELAYS, capacity=64):
+        """
+            Fleet constructor
+        :param num_relays: Number of relays per board, maximum 8
+        :param capacity: Initial number of boards, grows automatically
+        """
+        assert 1 <= num_relays <= 8
+        assert capacity > 0
+
+        self._num_relays = num_relays
+        self._relay_mask = (1 << num_relays) - 1
+        self._num_boards = 0
+
+        # Board index by (port, address), bus index by port
+        self._index = {}
+        self._ports = []
+        self._bus_index = {}
+        self._addresses = []
+        self._boards = []
+
+        # Packed relay states per board
+        self._desired = np.zeros(capacity, dtype=np.uint8)
+        self._observed = np.zeros(capacity, dtype=np.uint8)
+        self._known = np.zeros(capacity, dtype=np.uint8)
+        self._bus = np.zeros(capacity, dtype=np.int32)
+
+    @property
+    def num_boards(self):
+        return self._num_boards
+
+    @property
+    def num_relays(self):
+        return self._num_relays
+
+    @property
+    def ports(self):
+        return list(self._ports)
+
+    @property
+    def desired(self):
+        """
+            Get desired relay states
+        :return: Array uint8 with one bitmask per board, in order of adding the boards
+        """
+        return self._desired[:self._num_boards]
+
+    @property
+    def observed(self):
+        """
+            Get observed relay states
+        :return: Array uint8 with one bitmask per board, in order of adding the boards
+        """
+        return self._observed[:self._num_boards]
+
+    @property
+    def known(self):
+        """
+            Get relays with an observed state
+        :return: Array uint8 with one bitmask per board, in order of adding the boards
+        """
+        return self._known[:self._num_boards]
+
+    def _grow(self):
+        """
+            Double the capacity of the arrays
+        :return: None
+        """
+        capacity = 2 * len(self._desired)
+        for name in ('_desired', '_observed', '_known', '_bus'):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def add_board(self, port, address, board=None):
+        """
+            Add relay board
+        :param port: Serial port name
+        :param address: Board address
+        :param board: Optional R421A08 object to send commands by reconcile()
+        :return: Board index
+        """
+        key = (port, int(address))
+        if key in self._index:
+            index = self._index[key]
+            if board is not None:
+                self._boards[index] = board
+            return index
+
+        assert board is None or isinstance(board, R421A08)
+
+        if self._num_boards == len(self._desired):
+            self._grow()
+
+        if port not in self._bus_index:
+            self._bus_index[port] = len(self._ports)
+            self._ports.append(port)
+
+        index = self._num_boards
+        self._index[key] = index
+        self._addresses.append(int(address))
+        self._boards.append(board)
+        self._bus[index] = self._bus_index[port]
+        self._num_boards += 1
+
+        return index
+
+    def add_relay_board(self, board):
+        """
+            Add R421A08 object
+        :param board: R421A08 object
+        :return: Board index
+        """
+        return self.add_board(board.serial_port, board.address, board)
+
+    def get_index(self, port, address):
+        """
+            Get board index
+        :param port: Serial port name
+        :param address: Board address
+        :return: Board index
+        """
+        return self._index[(port, int(address))]
+
+    def set_desired(self, port, address, relay, status):
+        """
+            Set desired state of one relay
+        :param port: Serial port name
+        :param address: Board address
+        :param relay: Relay number
+        :param status: 0 = off, 1 = on
+        :return: None
+        """
+        assert 1 <= relay <= self._num_relays
+
+        index = self.get_index(port, address)
+        bit = 1 << (relay - 1)
+        if status:
+            self._desired[index] |= bit
+        else:
+            self._desired[index] &= ~bit & 0xFF
+
+    def set_desired_mask(self, port, address, mask):
+        """
+            Set desired state of all relays of a board
+        :param port: Serial port name
+        :param address: Board address
+        :param mask: Bitmask with bit 0 relay 1 .. bit 7 relay 8
+        :return: None
+        """
+        self._desired[self.get_index(port, address)] = mask & self._relay_mask
+
+    def set_observed_mask(self, port, address, mask):
+        """
+            Set observed state of all relays of a board
+        :param port: Serial port name
+        :param address: Board address
+        :param mask: Bitmask with bit 0 relay 1 .. bit 7 relay 8, -1 when unknown
+        :return: None
+        """
+        index = self.get_index(port, address)
+        if mask < 0:
+            self._known[index] = 0
+        else:
+            self._observed[index] = mask & self._relay_mask
+            self._known[index] = self._relay_mask
+
+    def set_observed(self, port, address, relay, status):
+        """
+            Set observed state of one relay
+        :param port: Serial port name
+        :param address: Board address
+        :param relay: Relay number
+        :param status: 0 = off, 1 = on, -1 = unknown
+        :return: None
+        """
+        assert 1 <= relay <= self._num_relays
+
+        index = self.get_index(port, address)
+        bit = 1 << (relay - 1)
+        if status < 0:
+            self._known[index] &= ~bit & 0xFF
+        else:
+            self._known[index] |= bit
+            if status:
+                self._observed[index] |= bit
+            else:
+                self._observed[index] &= ~bit & 0xFF
+
+    def get_diff(self):
+        """
+            Get relays with a desired state different from the observed state. Relays with an
+            unknown state are different.
+        :return: Array uint8 with one bitmask per board
+        """
+        n = self._num_boards
+        return ((self._desired[:n] ^ self._observed[:n]) | ~self._known[:n]) & self._relay_mask
+
+    def count_changes(self):
+        """
+            Count relays to switch per bus
+        :return: Dictionary {port: number of relays, ...}
+        """
+        changes = _POPCOUNT[self.get_diff()]
+        counts = np.bincount(self._bus[:self._num_boards], weights=changes,
+                             minlength=len(self._ports))
+
+        return dict((port, int(counts[bus])) for bus, port in enumerate(self._ports))
+
+    def get_commands(self):
+        """
+            Get minimal commands to switch all relays to the desired state. One whole-board or
+            latch frame is used when two or more relays of a board change.
+        :return: Dictionary with commands per bus {port: [(address, relay, cmd), ...], ...}
+        """
+        n = self._num_boards
+        diff = self.get_diff()
+        desired = self._desired[:n]
+        changes = _POPCOUNT[diff]
+
+        commands = dict((port, []) for port in self._ports)
+        board_frame = changes > 1
+
+        # One frame per board: All on, all off or latch the only relay on
+        all_on = board_frame & (desired == self._relay_mask)
+        all_off = board_frame & (desired == 0)
+        latch = board_frame & (_POPCOUNT[desired] == 1)
+
+        for mask, relays, cmd in ((all_on, None, CMD_ON_ALL),
+                                  (all_off, None, CMD_OFF_ALL),
+                                  (latch, _LOWEST_RELAY[desired], CMD_LATCH)):
+            for index in np.nonzero(mask)[0]:
+                relay = RELAY_ALL if relays is None else int(relays[index])
+                commands[self._ports[self._bus[index]]].append(
+                    (self._addresses[index], relay, cmd))
+
+        # One frame per changed relay
+        diff = np.where(all_on | all_off | latch, 0, diff).astype(np.uint8)
+        indexes = np.nonzero(diff)[0]
+        bits = np.unpackbits(diff[indexes][:, None], axis=1,
+                             bitorder='little')[:, :self._num_relays]
+        rows, columns = np.nonzero(bits)
+        on = (desired[indexes[rows]] >> columns.astype(np.uint8)) & 1
+
+        for row, column, status in zip(rows.tolist(), columns.tolist(), on.tolist()):
+            index = indexes[row]
+            commands[self._ports[self._bus[index]]].append(
+                (self._addresses[index], column + 1, CMD_ON if status else CMD_OFF))
+
+        for port_commands in commands.values():
+            port_commands.sort(key=lambda command: command[0])
+
+        return commands
+
+    def observe(self):
+        """
+            Read observed state of all boards added with an R421A08 object
+        :return: None
+        """
+        for index, board in enumerate(self._boards):
+            if board is not None:
+                self.set_observed_mask(self._ports[self._bus[index]], self._addresses[index],
+                                       board.get_status_mask())
+
+    def reconcile(self):
+        """
+            Send minimal commands to the boards added with an R421A08 object and update the
+            observed state with the accepted commands
+        :return:
+            True: All commands accepted
+            False: A command was not accepted, or a board was added without R421A08 object
+        """
+        success = True
+
+        for port, commands in self.get_commands().items():
+            for address, relay, cmd in commands:
+                index = self._index[(port, address)]
+                board = self._boards[index]
+
+                if board is None:
+                    success = False
+                    continue
+
+                if cmd == CMD_ON_ALL:
+                    accepted = board.on_all()
+                elif cmd == CMD_OFF_ALL:
+                    accepted = board.off_all()
+                elif cmd == CMD_LATCH:
+                    accepted = board.latch(relay)
+                elif cmd == CMD_ON:
+                    accepted = board.on(relay)
+                else:
+                    accepted = board.off(relay)
+
+                if not accepted:
+                    success = False
+                elif relay == RELAY_ALL or cmd == CMD_LATCH:
+                    self.set_observed_mask(port, address, int(self._desired[index]))
+                else:
+                    self.set_observed(port, address, relay, 1 if cmd == CMD_ON else 0)
+
+        return success
@@ -1,7 +1,16 @@
-from . modbus import Modbus, get_frame_str
-from . modbus import FRAME_DELAY
-from . modbus import SerialOpenException, TransferException
+from . modbus import Modbus, LockStats, get_frame_str, get_frame_crc
+from . modbus import FRAME_DELAY, DEFAULT_TURNAROUND_DELAY, get_frame_delay
+from . modbus import SerialOpenException, TransferException, SlaveException
 from . serial_ports import get_serial_ports
+from . scheduler import Scheduler, Transaction, PriorityStats
+from . scheduler import get_scheduler, combine_futures
+from . scheduler import PRIORITY_INTERACTIVE, PRIORITY_CONTROL, PRIORITY_BACKGROUND
+from . scheduler import OVERFLOW_BLOCK, OVERFLOW_FAIL, OVERFLOW_DROP_OLDEST
+from . scheduler import QueueFullException, DeadlineException
+from . scheduler import COALESCE_NONE, COALESCE_REPLACE, COALESCE_CANCEL, COALESCE_ANSWER
+from . single_flight import SingleFlight
+from . batch import Batch, BatchOperation
+from . crc import Crc16, crc16, crc16_bytes, crc16_check, crc16_batch
 
 __version__ = '1.0.1'
 VERSION = __version__
@@ -0,0 +1,264 @@
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+##
+# This module transfers MODBUS RTU frames with asyncio on POSIX serial ports
+#
+# Source: https://github.com/Erriez/R421A08-rs485-8ch-relay-board
+#
+
+import asyncio
+import os
+
+from . crc import crc16_bytes
+from . framer import Framer, RX_SILENCE, RX_DONE
+from . modbus import serial, get_frame_str, check_rx_frame
+from . modbus import DEFAULT_BAUDRATE, DEFAULT_TURNAROUND_DELAY, MAX_FRAME_LENGTH
+from . modbus import SerialOpenException, TransferException
+
+# asyncio.get_running_loop() requires Python 3.7, get_event_loop() returns the running loop in
+# coroutines on Python 3.6
+get_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+
+class AsyncModbus(object):
+    """ MODBUS RTU transfers driven by an asyncio event loop without threads """
+
+    def __init__(self, serial_port=None, baud_rate=DEFAULT_BAUDRATE, verbose=False,
+                 turnaround_delay=DEFAULT_TURNAROUND_DELAY):
+        """
+            AsyncModbus constructor. The serial port file descriptor is registered with the event
+            loop, which is supported on POSIX systems only.
+        :param serial_port: Serial port such as '/dev/ttyUSB0'
+        :param baud_rate: Serial baudrate
+        :param verbose: Print transmit and receive frames to console
+        :param turnaround_delay: Additional delay in seconds between frames for slow USB - RS485
+            dongles
+        """
+        assert type(verbose) == bool
+        assert turnaround_delay >= 0
+
+        self._serial_port = serial_port
+        self._verbose = verbose
+        self._turnaround_delay = float(turnaround_delay)
+
+        # Non-blocking serial port: Reads and writes return immediately
+        self._ser = serial.Serial()
+        self._ser.baudrate = int(baud_rate)
+        self._ser.bytesize = 8
+        self._ser.stopbits = 1
+        self._ser.parity = serial.PARITY_NONE
+        self._ser.timeout = 0
+        self._ser.write_timeout = 0
+        self._fd = None
+
+        self._framer = Framer(baud_rate, turnaround_delay)
+
+        # One transfer at a time
+        self._lock = asyncio.Lock()
+
+    @property
+    def serial_port(self):
+        return self._serial_port
+
+    @property
+    def baudrate(self):
+        return self._ser.baudrate
+
+    @property
+    def turnaround_delay(self):
+        return self._turnaround_delay
+
+    @property
+    def frame_delay(self):
+        return self._framer.frame_delay
+
+    @property
+    def rx_discarded(self):
+        return self._framer.rx_discarded
+
+    def open(self):
+        # Open serial port
+        try:
+            self._ser.port = self._serial_port
+            self._ser.open()
+        except serial.SerialException as err:
+            raise SerialOpenException('Error: Cannot open serial port: ' + str(err))
+
+        self._fd = self._ser.fileno()
+
+    def close(self):
+        self._ser.close()
+        self._fd = None
+
+    def is_open(self):
+        return self._ser.is_open
+
+    async def __aenter__(self):
+        await self._lock.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self._lock.release()
+        return False
+
+    async def send_frame(self, tx_frame, append_crc_to_frame=True, reply_length=0):
+        """
+            MODBUS send frame
+        :param tx_frame: Frame data (bytes, bytearray or memoryview)
+        :param append_crc_to_frame: Append CRC to TX frame
+        :param reply_length: Length of a response which is not received, see Modbus.send_frame()
+        :return: None
+        """
+        async with self._lock:
+            await self._send_frame(tx_frame, append_crc_to_frame, reply_length)
+
+    async def transfer_frame(self, tx_frame, append_crc_to_tx_frame=True, rx_length=0):
+        """
+            Send MODBUS frame and return receive frame with timeout
+        :param tx_frame: Frame data (bytes, bytearray or memoryview)
+        :param append_crc_to_tx_frame: Append CRC to TX frame
+        :param rx_length: Receive length, 0 for unknown length
+        :return: Received frame (bytes)
+        """
+        async with self._lock:
+            await self._send_frame(tx_frame, append_crc_to_tx_frame)
+            return await self._receive_frame(rx_length)
+
+    async def _send_frame(self, tx_frame, append_crc_to_frame=True, reply_length=0):
+        """
+            Send frame, called with the lock acquired
+        :param tx_frame: Frame data (bytes, bytearray or memoryview)
+        :param append_crc_to_frame: Append CRC to TX frame
+        :param reply_length: Length of a response which is not received
+        :return: None
+        """
+        assert isinstance(tx_frame, (bytes, bytearray, memoryview))
+        assert len(tx_frame) <= MAX_FRAME_LENGTH - 2
+
+        if self._fd is None:
+            raise TransferException('TX error: Serial port not open')
+
+        tx_frame = bytearray(tx_frame)
+        if append_crc_to_frame:
+            tx_frame += crc16_bytes(tx_frame)
+
+        # Wait remaining delay between frames with a loop timer
+        delay = self._framer.get_idle_delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        # Clear receive
+        self._framer.discard(self._fd, self._verbose)
+
+        # Print transmit frame
+        if self._verbose:
+            print(get_frame_str('TX', tx_frame))
+
+        await self._write(tx_frame)
+
+        self._framer.transmitted(len(tx_frame), reply_length)
+
+    async def _write(self, tx_frame):
+        """
+            Write frame to the non-blocking serial port, waiting for the event loop when the
+            transmit buffer is full
+        :param tx_frame: Frame data
+        :return: None
+        """
+        loop = get_running_loop()
+        tx_view = memoryview(tx_frame)
+
+        while tx_view:
+            try:
+                tx_count = os.write(self._fd, tx_view)
+            except BlockingIOError:
+                tx_count = 0
+            except OSError:
+                raise TransferException('TX error: Serial write failed')
+            tx_view = tx_view[tx_count:]
+
+            if tx_view:
+                writable = loop.create_future()
+                loop.add_writer(self._fd, writable.set_result, None)
+                try:
+                    await writable
+                finally:
+                    loop.remove_writer(self._fd)
+
+    async def _receive_frame(self, rx_length):
+        """
+            Receive frame with the serial port registered as reader in the event loop
+        :param rx_length: Receive length, 0 for unknown length
+        :return: Received frame (bytes)
+        """
+        loop = get_running_loop()
+        done = loop.create_future()
+        timer = [None]
+
+        def finish():
+            if not done.done():
+                done.set_result(None)
+
+        def restart_timer(delay):
+            if timer[0] is not None:
+                timer[0].cancel()
+            timer[0] = loop.call_later(delay, finish)
+
+        def readable():
+            try:
+                rx_state = self._framer.read(self._fd)
+            except TransferException as err:
+                if not done.done():
+                    done.set_exception(err)
+                return
+
+            if rx_state == RX_DONE:
+                finish()
+            elif rx_state == RX_SILENCE:
+                # End of frame when the bus is silent for the delay between frames
+                restart_timer(self._framer.frame_delay)
+
+        restart_timer(self._framer.start(rx_length))
+
+        loop.add_reader(self._fd, readable)
+        try:
+            await done
+        finally:
+            loop.remove_reader(self._fd)
+            timer[0].cancel()
+            rx_frame = self._framer.get_frame()
+
+        # Check read timeout
+        if not rx_frame:
+            raise TransferException('RX error: Receive timeout')
+
+        # Print receive frame
+        if self._verbose:
+            print(get_frame_str('RX', rx_frame))
+
+        # Check exception response and receive length
+        check_rx_frame(rx_frame, rx_length)
+
+        return rx_frame
@@ -0,0 +1,154 @@
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+##
+# This module collects operations on MODBUS slaves and executes them in one pass
+#
+# Source: https://github.com/Erriez/R421A08-rs485-8ch-relay-board
+#
+
+
+class BatchOperation(object):
+    """ Operation recorded in a batch """
+
+    def __init__(self, target, name, args):
+        """
+            BatchOperation constructor
+        :param target: Object executing the operation
+        :param name: Operation name or command
+        :param args: Tuple operation arguments
+        """
+        self.target = target
+        self.name = name
+        self.args = args
+        self.result = None
+        self.exception = None
+        self.done = False
+
+    def set_result(self, result):
+        """
+            Complete operation with a result
+        :param result: Operation result
+        :return: None
+        """
+        self.result = result
+        self.done = True
+
+    def set_exception(self, exception):
+        """
+            Complete operation with an exception
+        :param exception: Exception object
+        :return: None
+        """
+        self.exception = exception
+        self.done = True
+
+
+class Batch(object):
+    """ Collect operations and execute them in one pass when leaving the with block """
+
+    def __init__(self, modbus=None, raise_exception=True):
+        """
+            Batch constructor
+        :param modbus: Optional Modbus object of the targets
+        :param raise_exception:
+            True: flush() raises the first operation exception after executing all operations,
+                like the relay board functions without a batch (Default)
+            False: Exceptions are stored in the operations only
+        """
+        self._modbus = modbus
+        self._raise_exception = bool(raise_exception)
+        self._operations = []
+
+    @property
+    def modbus(self):
+        return self._modbus
+
+    @property
+    def operations(self):
+        """
+            Get recorded operations which are not executed
+        :return: List BatchOperation objects
+        """
+        return list(self._operations)
+
+    def add(self, target, name, *args):
+        """
+            Record operation
+        :param target: Object with a batch_key property and a flush_batch(operations) function
+        :param name: Operation name or command
+        :param args: Operation arguments
+        :return: BatchOperation object, completed by flush()
+        """
+        operation = BatchOperation(target, name, args)
+        self._operations.append(operation)
+
+        return operation
+
+    def flush(self):
+        """
+            Execute recorded operations, ordered by the batch_key of the targets. Operations of
+            one target are passed to the target in recording order. Targets may merge
+            operations, the result of a merged operation is the result of the frames carrying it.
+        :return: List results in recording order, None for operations with an exception
+        :raise: First operation exception when raise_exception is set
+        """
+        operations, self._operations = self._operations, []
+
+        targets = []
+        target_operations = {}
+        for operation in operations:
+            key = id(operation.target)
+            if key not in target_operations:
+                targets.append(operation.target)
+                target_operations[key] = []
+            target_operations[key].append(operation)
+
+        if self._modbus is not None:
+            # Keep the bus for the complete batch
+            self._modbus.transfer_begin()
+        try:
+            for target in sorted(targets, key=lambda target: target.batch_key):
+                target.flush_batch(target_operations[id(target)])
+        finally:
+            if self._modbus is not None:
+                self._modbus.transfer_end()
+
+        if self._raise_exception:
+            for operation in operations:
+                if operation.exception is not None:
+                    raise operation.exception
+
+        return [operation.result for operation in operations]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Discard operations when the with block raised an exception
+        if exc_type is None:
+            self.flush()
+        else:
+            self._operations = []
+        return False
@@ -0,0 +1,165 @@
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+##
+# This module calculates the MODBUS RTU CRC with a 16-bit lookup table
+#
+# Source: https://github.com/Erriez/R421A08-rs485-8ch-relay-board
+#
+
+# MODBUS CRC polynomial (0x8005 reflected) and initial value
+CRC_POLYNOMIAL = 0xA001
+CRC_INIT = 0xFFFF
+
+
+def _create_crc_table():
+    """
+        Create 16-bit CRC lookup table
+    :return: Tuple with 256 CRC values
+    """
+    table = []
+
+    for index in range(0, 256):
+        crc = index
+        for _ in range(0, 8):
+            if crc & 0x0001:
+                crc = (crc >> 1) ^ CRC_POLYNOMIAL
+            else:
+                crc >>= 1
+        table.append(crc)
+
+    return tuple(table)
+
+
+# MODBUS CRC table
+CRC_TABLE = _create_crc_table()
+
+
+def crc16(data, crc=CRC_INIT):
+    """
+        Calculate MODBUS CRC
+    :param data: bytes, bytearray, memoryview or list data (int)
+    :param crc: Initial CRC value, or CRC of the previous data to continue the calculation
+    :return: CRC (int), low Byte is transmitted first
+    """
+    table = CRC_TABLE
+
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+
+    return crc
+
+
+def crc16_bytes(data):
+    """
+        Calculate MODBUS CRC Bytes
+    :param data: bytes, bytearray, memoryview or list data (int)
+    :return: CRC Bytes in frame order (bytearray)
+    """
+    crc = crc16(data)
+
+    return bytearray((crc & 0xFF, crc >> 8))
+
+
+def crc16_check(frame):
+    """
+        Check CRC at the end of a frame
+    :param frame: bytes, bytearray, memoryview or list data (int) including CRC
+    :return:
+        True: CRC correct
+        False: CRC incorrect
+    """
+    # The CRC over data and CRC Bytes is always zero
+    return len(frame) > 2 and crc16(frame) == 0
+
+
+def crc16_batch(frames):
+    """
+        Calculate MODBUS CRC of multiple frames
+    :param frames: Iterable with frames
+    :return: List CRC (int) per frame
+    """
+    table = CRC_TABLE
+    crcs = []
+
+    for frame in frames:
+        crc = CRC_INIT
+        for byte in frame:
+            crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+        crcs.append(crc)
+
+    return crcs
+
+
+class Crc16(object):
+    """ Incremental MODBUS CRC calculation """
+
+    def __init__(self, data=None):
+        """
+            Incremental MODBUS CRC constructor
+        :param data: Optional first data
+        """
+        self._crc = CRC_INIT
+
+        if data:
+            self.update(data)
+
+    @property
+    def value(self):
+        """
+            Get CRC
+        :return: CRC (int)
+        """
+        return self._crc
+
+    def update(self, data):
+        """
+            Add data to the CRC calculation
+        :param data: bytes, bytearray, memoryview or list data (int)
+        :return: None
+        """
+        self._crc = crc16(data, self._crc)
+
+    def reset(self):
+        """
+            Restart the CRC calculation
+        :return: None
+        """
+        self._crc = CRC_INIT
+
+    def digest(self):
+        """
+            Get CRC Bytes
+        :return: CRC Bytes in frame order (bytes)
+        """
+        return bytes(bytearray((self._crc & 0xFF, self._crc >> 8)))
+
+    def copy(self):
+        """
+            Copy CRC calculation
+        :return: New Crc16 object with the same state
+        """
+        crc = Crc16()
+        crc._crc = self._crc
+        return crc
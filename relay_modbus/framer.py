@@ -0,0 +1,173 @@
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+##
+# This module frames MODBUS RTU transfers on non-blocking serial ports, shared by the asyncio and
+# multiplexer transfers
+#
+# Source: https://github.com/Erriez/R421A08-rs485-8ch-relay-board
+#
+
+import os
+
+from . modbus import monotonic, get_frame_delay, get_frame_str, get_rx_length
+from . modbus import CHAR_BITS, FRAME_RX_TIMEOUT, RX_TIMEOUT, MAX_FRAME_LENGTH
+from . modbus import TransferException
+
+
+# Receive states returned by Framer.read()
+RX_WAIT = 0         # Frame not complete
+RX_SILENCE = 1      # Data received: Restart silence timer, end of frame after frame_delay
+RX_DONE = 2         # Frame complete
+
+
+class Framer(object):
+    """ MODBUS RTU frame timing and receive state machine of a non-blocking serial port """
+
+    def __init__(self, baud_rate, turnaround_delay):
+        """
+            Framer constructor
+        :param baud_rate: Serial baudrate
+        :param turnaround_delay: Additional delay in seconds between frames for slow USB - RS485
+            dongles
+        """
+        self.char_time = CHAR_BITS / float(baud_rate)
+        self.frame_delay = get_frame_delay(baud_rate, turnaround_delay)
+
+        # Timestamp when the bus is idle and the next frame may be transmitted
+        self.bus_idle_time = 0.0
+
+        # Number of received Bytes discarded before transmitting frames
+        self.rx_discarded = 0
+
+        self._rx_buffer = bytearray(MAX_FRAME_LENGTH)
+        self._rx_length = 0
+        self._rx_expected = 0
+
+    def get_idle_delay(self):
+        """
+            Get remaining delay between frames since last bus activity
+        :return: Delay in seconds, 0 or negative when the bus is idle
+        """
+        return self.bus_idle_time - monotonic()
+
+    def discard(self, fd, verbose=False):
+        """
+            Discard received data before transmitting a frame
+        :param fd: Serial port file descriptor
+        :param verbose: Print discarded data to console
+        :return: None
+        """
+        while True:
+            try:
+                data = os.read(fd, MAX_FRAME_LENGTH)
+            except BlockingIOError:
+                break
+            except OSError:
+                raise TransferException('RX error: Read failed')
+            if not data:
+                break
+
+            if verbose:
+                print(get_frame_str('RX discarded', data))
+            self.rx_discarded += len(data)
+
+    def transmitted(self, tx_length, reply_length=0):
+        """
+            Frame written: Next frame may be transmitted after transmitting this frame on the bus and
+            the delay between frames
+        :param tx_length: Transmit length including CRC
+        :param reply_length: Length of a response which is not received. The bus is reserved for
+            the response.
+        :return: None
+        """
+        self.bus_idle_time = monotonic() + ((tx_length + reply_length) * self.char_time) + \
+            self.frame_delay
+
+    def start(self, rx_length):
+        """
+            Start receiving a frame
+        :param rx_length: Receive length, 0 for unknown length
+        :return: Receive timeout in seconds. Restart the timer with frame_delay when read()
+            returns RX_SILENCE.
+        """
+        assert type(rx_length) == int
+        if rx_length:
+            assert 0 < rx_length < 255
+
+        self._rx_length = 0
+        self._rx_expected = rx_length
+
+        if rx_length:
+            return RX_TIMEOUT + (rx_length * self.char_time)
+        else:
+            # Wait for the first Byte of a frame with unknown length
+            return FRAME_RX_TIMEOUT
+
+    def read(self, fd):
+        """
+            Read received data. A frame with known length is complete after the receive length, or
+            the exception response length. A frame with unknown length is complete when the bus is
+            silent for the delay between frames, or at the maximum frame length.
+        :param fd: Serial port file descriptor
+        :return: RX_WAIT, RX_SILENCE or RX_DONE
+        """
+        try:
+            data = os.read(fd, MAX_FRAME_LENGTH - self._rx_length)
+        except BlockingIOError:
+            return RX_WAIT
+        except OSError:
+            raise TransferException('RX error: Serial read failed')
+
+        self._rx_buffer[self._rx_length:self._rx_length + len(data)] = data
+        self._rx_length += len(data)
+
+        if self._rx_expected:
+            if self._rx_length >= 2:
+                self._rx_expected = get_rx_length(self._rx_buffer, self._rx_expected)
+            if self._rx_length >= self._rx_expected:
+                return RX_DONE
+        elif self._rx_length >= MAX_FRAME_LENGTH:
+            return RX_DONE
+        elif data:
+            return RX_SILENCE
+
+        return RX_WAIT
+
+    def get_frame(self):
+        """
+            Get received frame at the end of the receive and delay the next frame from the end of
+            the receive
+        :return: Received frame (bytes), empty on a receive timeout. Bytes received after a frame
+            with known length are ignored.
+        """
+        rx_length = self._rx_length
+        if self._rx_expected:
+            rx_length = min(rx_length, self._rx_expected)
+        self._rx_length = 0
+
+        self.bus_idle_time = monotonic() + self.frame_delay
+
+        return bytes(self._rx_buffer[:rx_length])
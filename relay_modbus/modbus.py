@@ -33,6 +33,15 @@ import threading
 import time
 
 from print_stderr import print_stderr
+from . crc import crc16_bytes, crc16_check
+from . single_flight import SingleFlight
+from . batch import Batch
+
+try:
+    from time import monotonic
+except ImportError:
+    # Python 2 and lower
+    from time import time as monotonic
 
 try:
     import serial
@@ -60,12 +69,49 @@ DEFAULT_BAUDRATE = 9600
 # Wait at least 3.5 char between frames
 # However, some USB - RS485 dongles requires at least 10ms to switch between TX and RX, so use a
 # save delay between frames
+# Note: The delay between transmitted frames is derived from the baudrate, see get_frame_delay()
 FRAME_DELAY = 0.025
 
+# Number of bits per MODBUS RTU character: Start bit, 8 data bits, parity/stop bit and stop bit
+CHAR_BITS = 11
+
+# According to MODBUS specification: Fixed 1.75ms inter-frame delay above 19200 baud
+FRAME_DELAY_MIN = 0.00175
+
+# Default margin on top of the inter-frame delay for USB - RS485 dongles switching between TX and RX
+DEFAULT_TURNAROUND_DELAY = 0.010
+
 # Frame receive timeout
 FRAME_RX_TIMEOUT = 0.050
 
+# Receive timeout of a frame with known length
+RX_TIMEOUT = 0.1
+
+# Maximum time to discard received data before transmitting a frame
+FLUSH_TIMEOUT = 0.010
+
+# According to MODBUS specification: Maximum RTU frame length
+MAX_FRAME_LENGTH = 256
+
+# Exception response: Address, function | 0x80, exception code, CRC
+EXCEPTION_FRAME_LENGTH = 5
+EXCEPTION_FUNCTION_FLAG = 0x80
+
+# According to MODBUS specification: Exception codes
+EXCEPTION_CODES = {
+    0x01: 'Illegal function',
+    0x02: 'Illegal data address',
+    0x03: 'Illegal data value',
+    0x04: 'Slave device failure',
+    0x05: 'Acknowledge',
+    0x06: 'Slave device busy',
+    0x08: 'Memory parity error',
+    0x0A: 'Gateway path unavailable',
+    0x0B: 'Gateway target device failed to respond',
+}
+
 # MODBUS CRC tables
+# Note: CRC is calculated with the 16-bit table of the crc module which is bit-identical
 CRC_HI = [
     0x00, 0xC1, 0x81, 0x40, 0x01, 0xC0, 0x80, 0x41, 0x01, 0xC0, 0x80, 0x41, 0x00, 0xC1, 0x81, 0x40,
     0x01, 0xC0, 0x80, 0x41, 0x00, 0xC1, 0x81, 0x40, 0x00, 0xC1, 0x81, 0x40, 0x01, 0xC0, 0x80, 0x41,
@@ -105,6 +151,24 @@ CRC_LOW = [
 ]
 
 
+def get_frame_delay(baud_rate, turnaround_delay=DEFAULT_TURNAROUND_DELAY):
+    """
+        Get MODBUS inter-frame delay (t3.5) for a baudrate
+    :param baud_rate: Serial baudrate
+    :param turnaround_delay: Additional delay in seconds for RS485 dongles switching TX and RX
+    :return: Delay in seconds
+    """
+    assert baud_rate > 0
+    assert turnaround_delay >= 0
+
+    if baud_rate > 19200:
+        frame_delay = FRAME_DELAY_MIN
+    else:
+        frame_delay = (3.5 * CHAR_BITS) / baud_rate
+
+    return frame_delay + turnaround_delay
+
+
 class SerialOpenException(Exception):
     pass
 
@@ -113,15 +177,100 @@ class TransferException(Exception):
     pass
 
 
+class SlaveException(TransferException):
+    """ Exception response received from a slave """
+
+    def __init__(self, address, function, code):
+        self.address = address
+        self.function = function
+        self.code = code
+
+        super(SlaveException, self).__init__(
+            'RX error: Exception response function 0x{:02X} code 0x{:02X}: {}'.format(
+                function, code, EXCEPTION_CODES.get(code, 'Unknown exception')))
+
+
+def check_rx_frame(rx_frame, rx_length):
+    """
+        Check received frame for an exception response and the receive length
+    :param rx_frame: Received frame
+    :param rx_length: Expected receive length, 0 for unknown length
+    :return: None
+    """
+    # Check exception response
+    if rx_length and len(rx_frame) >= 2 and rx_frame[1] & EXCEPTION_FUNCTION_FLAG:
+        if len(rx_frame) != EXCEPTION_FRAME_LENGTH:
+            raise TransferException('RX error: Incorrect exception response length')
+        elif not crc16_check(rx_frame):
+            raise TransferException('RX error: Incorrect CRC received')
+        raise SlaveException(rx_frame[0], rx_frame[1] & ~EXCEPTION_FUNCTION_FLAG, rx_frame[2])
+
+    # Check response: TX data must be the same as RX data
+    if rx_length and len(rx_frame) != rx_length:
+        raise TransferException('RX error: Incorrect receive length {} '
+                                'Bytes, expected {} Bytes.'.format(len(rx_frame), rx_length))
+
+
+def get_rx_length(rx_frame, rx_length):
+    """
+        Get length of a response with known length from the address and function
+    :param rx_frame: Received Bytes, at least address and function
+    :param rx_length: Receive length
+    :return: Receive length, EXCEPTION_FRAME_LENGTH for an exception response
+    """
+    if rx_frame[1] & EXCEPTION_FUNCTION_FLAG:
+        # Exception response: Exception code and CRC
+        return EXCEPTION_FRAME_LENGTH
+
+    return rx_length
+
+
+class LockStats(object):
+    """ Serial port lock statistics """
+
+    def __init__(self):
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.hold_time = 0.0
+        self.max_hold_time = 0.0
+
+    @property
+    def average_wait_time(self):
+        """
+            Get average time waiting for the lock
+        :return: Time in seconds
+        """
+        if not self.acquisitions:
+            return 0.0
+        return self.wait_time / self.acquisitions
+
+    @property
+    def average_hold_time(self):
+        """
+            Get average time holding the lock
+        :return: Time in seconds
+        """
+        if not self.acquisitions:
+            return 0.0
+        return self.hold_time / self.acquisitions
+
+
 class Modbus(object):
     """ Modbus class """
 
-    def __init__(self, serial_port=None, baud_rate=DEFAULT_BAUDRATE, verbose=False):
+    def __init__(self, serial_port=None, baud_rate=DEFAULT_BAUDRATE, verbose=False,
+                 turnaround_delay=DEFAULT_TURNAROUND_DELAY, reply_delay=0.0):
         """
             Modbus constructor
         :param serial_port: Serial port such as 'COM1' on Windows and '/dev/ttyUSB0' on Linux.
         :param baud_rate: Serial baudrate
         :param verbose: Print transmit and receive frames to console
+        :param turnaround_delay: Additional delay in seconds between frames for slow USB - RS485
+            dongles
+        :param reply_delay: Additional time in seconds reserved for a response which is not
+            received, for slaves starting the response later than the delay between frames
         """
         # Make sure previous prints are flushed to the console
         if sys.stderr:
@@ -131,6 +280,8 @@ class Modbus(object):
 
         # Argument checks
         assert type(verbose) == bool
+        assert turnaround_delay >= 0
+        assert reply_delay >= 0
 
         # Store variables
         self._serial_port = serial_port
@@ -141,14 +292,36 @@ class Modbus(object):
         self._ser.bytesize = 8
         self._ser.stopbits = 1
         self._ser.parity = serial.PARITY_NONE
-        self._ser.timeout = 0.1
+        self._ser.timeout = RX_TIMEOUT
         self._verbose = verbose
-        self._tx_data = []
-        self._rx_data = []
+        self._turnaround_delay = float(turnaround_delay)
+        self._reply_delay = float(reply_delay)
+
+        # Preallocated transmit and receive frame buffers
+        self._tx_buffer = bytearray(MAX_FRAME_LENGTH)
+        self._tx_view = memoryview(self._tx_buffer)
+        self._tx_length = 0
+        self._rx_buffer = bytearray(MAX_FRAME_LENGTH)
+        self._rx_view = memoryview(self._rx_buffer)
+        self._rx_length = 0
         self._monitor_thread = None
+        self._scheduler = None
+
+        # Timestamp when the bus is idle and the next frame may be transmitted
+        self._bus_idle_time = 0.0
 
-        # Create lock
-        self._lock = threading.Lock()
+        # Number of received Bytes discarded before transmitting frames
+        self._rx_discarded = 0
+
+        # Create reentrant lock, owned by one thread during a transfer or sequence of transfers
+        self._lock = threading.RLock()
+        self._lock_owner = None
+        self._lock_depth = 0
+        self._lock_time = 0.0
+        self._lock_stats = LockStats()
+
+        # Concurrent identical reads of relay boards on this bus share one transaction
+        self._single_flight = SingleFlight()
 
     def __del__(self):
         """
@@ -191,14 +364,96 @@ class Modbus(object):
         """
         return self._ser.baudrate
 
+    @property
+    def turnaround_delay(self):
+        """
+            Get additional delay between frames for the USB - RS485 dongle
+        :return: Delay in seconds
+        """
+        return self._turnaround_delay
+
+    @turnaround_delay.setter
+    def turnaround_delay(self, turnaround_delay):
+        """
+            Set additional delay between frames for the USB - RS485 dongle
+        :param turnaround_delay: Delay in seconds
+        """
+        assert turnaround_delay >= 0
+        self._turnaround_delay = float(turnaround_delay)
+
+    @property
+    def reply_delay(self):
+        """
+            Get additional time reserved for a response which is not received
+        :return: Delay in seconds
+        """
+        return self._reply_delay
+
+    @reply_delay.setter
+    def reply_delay(self, reply_delay):
+        """
+            Set additional time reserved for a response which is not received
+        :param reply_delay: Delay in seconds
+        """
+        assert reply_delay >= 0
+        self._reply_delay = float(reply_delay)
+
+    @property
+    def frame_delay(self):
+        """
+            Get delay between frames, derived from the baudrate and turnaround delay
+        :return: Delay in seconds
+        """
+        return get_frame_delay(self._ser.baudrate, self._turnaround_delay)
+
+    @property
+    def scheduler(self):
+        """
+            Get scheduler executing the transactions of relay boards using this Modbus object
+        :return: Scheduler object or None when not started
+        """
+        return self._scheduler
+
+    @scheduler.setter
+    def scheduler(self, scheduler):
+        """
+            Set scheduler, called by the scheduler when started or stopped
+        :param scheduler: Scheduler object or None
+        """
+        self._scheduler = scheduler
+
+    @property
+    def single_flight(self):
+        """
+            Get SingleFlight object sharing concurrent identical reads on this bus
+        :return: SingleFlight object
+        """
+        return self._single_flight
+
+    @property
+    def lock_stats(self):
+        """
+            Get serial port lock statistics
+        :return: LockStats object
+        """
+        return self._lock_stats
+
+    @property
+    def rx_discarded(self):
+        """
+            Get number of received Bytes discarded before transmitting frames
+        :return: Number of Bytes
+        """
+        return self._rx_discarded
+
     @property
     def last_tx_frame(self):
         """
             Get last transmitted frame
         :return: Frame string
         """
-        if self._tx_data:
-            return get_frame_str('TX:', self._tx_data)
+        if self._tx_length:
+            return get_frame_str('TX:', self._tx_view[:self._tx_length])
         else:
             return ''
 
@@ -208,8 +463,8 @@ class Modbus(object):
             Get last received frame
         :return: Frame string
         """
-        if self._rx_data:
-            return get_frame_str('RX:', self._rx_data)
+        if self._rx_length:
+            return get_frame_str('RX:', self._rx_view[:self._rx_length])
         else:
             return ''
 
@@ -239,15 +494,7 @@ class Modbus(object):
         """
         assert type(data) == list
 
-        crc_high = 0xFF
-        crc_low = 0xFF
-
-        for i in range(0, len(data)):
-            index = crc_high ^ data[i]
-            crc_high = crc_low ^ CRC_HI[index]
-            crc_low = CRC_LOW[index]
-
-        return [crc_high, crc_low]
+        return list(get_frame_crc(data))
 
     def send(self, tx_data, append_crc_to_frame=True):
         """
@@ -258,20 +505,41 @@ class Modbus(object):
         """
         assert type(tx_data) == list
 
-        self._tx_data = tx_data
+        self.send_frame(bytearray(tx_data), append_crc_to_frame)
+
+    def send_frame(self, tx_frame, append_crc_to_frame=True, reply_length=0):
+        """
+            MODBUS send frame
+        :param tx_frame: Frame data (bytes, bytearray or memoryview)
+        :param append_crc_to_frame: Append CRC to TX frame
+        :param reply_length: Length of a response which is not received. The bus is reserved for
+            the response and the response is discarded before transmitting the next frame.
+            The reservation assumes the slave starts the response within the delay between
+            frames (t3.5 and the turnaround delay) plus reply_delay, and transmits it without
+            gaps: frame + delay between frames + reply_delay + response.
+        :return: None
+        """
+        assert isinstance(tx_frame, (bytes, bytearray, memoryview))
+        assert len(tx_frame) <= MAX_FRAME_LENGTH - 2
+
+        # Copy frame to transmit buffer
+        tx_length = len(tx_frame)
+        self._tx_buffer[:tx_length] = tx_frame
 
         if append_crc_to_frame:
             # Append CRC to transmit frame
-            self._tx_data += self.crc(self._tx_data)
+            self._tx_buffer[tx_length:tx_length + 2] = get_frame_crc(self._tx_view[:tx_length])
+            tx_length += 2
 
-        # Print transmit frame
-        if self._verbose:
-            print(get_frame_str('TX', self._tx_data))
+        self._tx_length = tx_length
+        tx_frame = self._tx_view[:tx_length]
+
+        # Wait remaining delay between frames since last bus activity
+        self._wait_bus_idle()
 
         try:
             # Clear receive
-            while self._ser.read_all():
-                time.sleep(0.010)
+            self._flush_receive()
         except serial.SerialException:
             # Windows: Serial exception
             raise TransferException('RX error: Read failed')
@@ -279,16 +547,28 @@ class Modbus(object):
             # Ubuntu: Attribute error (Not documented)
             raise TransferException('RX error: Read failed')
 
+        # Print transmit frame
+        if self._verbose:
+            print(get_frame_str('TX', tx_frame))
+
         # Write binary command to relay card over serial port
         try:
-            self._ser.write(tx_data)
+            self._ser.write(tx_frame)
         except serial.SerialTimeoutException:
             raise TransferException('TX error: Serial write timeout')
         except serial.SerialException:
             raise TransferException('TX error: Serial write failed')
 
-        # Wait between transmitting frames
-        time.sleep(FRAME_DELAY)
+        # Next frame may be transmitted after transmitting this frame on the bus and the delay
+        # between frames. The delay is only waited when transmitting the next frame.
+        self._bus_idle_time = monotonic() + \
+            ((tx_length * CHAR_BITS) / float(self._ser.baudrate)) + self.frame_delay
+
+        if reply_length:
+            # Fire and forget: Do not transmit during the response of the slave, which starts
+            # within the delay between frames and the reply delay
+            self._bus_idle_time += ((reply_length * CHAR_BITS) / float(self._ser.baudrate)) + \
+                self._reply_delay
 
     def receive(self, rx_length):
         """
@@ -296,44 +576,46 @@ class Modbus(object):
         :param rx_length: Receive length
         :return: List received data (int)
         """
+        return list(bytearray(self.receive_frame(rx_length)))
+
+    def receive_frame(self, rx_length):
+        """
+            MODBUS receive frame
+        :param rx_length: Receive length
+        :return: Received frame (memoryview), valid until the next receive
+        """
         assert type(rx_length) == int
         if rx_length:
             assert 0 < rx_length < 255
 
-        # Read response with timeout
+        # Read response with timeout in receive buffer
+        self._rx_length = 0
         try:
             if rx_length:
-                rx_data = self._ser.read(rx_length)
+                self._rx_length = self._read_fixed_length(rx_length)
             else:
                 # Wait for response without known receive length
-                time.sleep(FRAME_RX_TIMEOUT)
-                rx_data = self._ser.read_all()
+                self._rx_length = self._read_until_silence()
         except serial.SerialException:
             raise TransferException('RX error: Serial read failed')
+        finally:
+            # Delay next frame from end of receive
+            self._bus_idle_time = monotonic() + self.frame_delay
 
         # Check read timeout
-        if not rx_data:
+        if not self._rx_length:
             raise TransferException('RX error: Receive timeout')
 
-        # Convert bytearray to list
-        if sys.version_info[0] >= 3:
-            # Python 3 and higher
-            self._rx_data = [int(i) for i in rx_data]
-        else:
-            # Python 2 and lower
-            self._rx_data = [ord(i) for i in rx_data]
+        rx_frame = self._rx_view[:self._rx_length]
 
         # Print receive frame
         if self._verbose:
-            print(get_frame_str('RX', self._rx_data))
+            print(get_frame_str('RX', rx_frame))
 
-        # Check response: TX data must be the same as RX data
-        if rx_length and len(self._rx_data) != rx_length:
-            raise TransferException('RX error: Incorrect receive length {} '
-                                    'Bytes, expected {} Bytes.'.format(len(self._rx_data),
-                                                                       rx_length))
+        # Check exception response and receive length
+        check_rx_frame(rx_frame, rx_length)
 
-        return self._rx_data
+        return rx_frame
 
     def transfer(self, tx_data, append_crc_to_tx_frame=True, rx_length=0):
         """
@@ -343,15 +625,187 @@ class Modbus(object):
         :param rx_length:
         :return:
         """
-        self.send(tx_data, append_crc_to_tx_frame)
-        return self.receive(rx_length)
+        with self:
+            self.send(tx_data, append_crc_to_tx_frame)
+            return self.receive(rx_length)
+
+    def transfer_frame(self, tx_frame, append_crc_to_tx_frame=True, rx_length=0):
+        """
+            Send MODBUS frame and return receive frame with timeout
+        :param tx_frame: Frame data (bytes, bytearray or memoryview)
+        :param append_crc_to_tx_frame: Append CRC to TX frame
+        :param rx_length: Receive length, 0 for unknown length
+        :return: Received frame (memoryview), valid until the next receive. Lock the serial port
+            with transfer_begin() to use the frame after the transfer.
+        """
+        with self:
+            self.send_frame(tx_frame, append_crc_to_tx_frame)
+            return self.receive_frame(rx_length)
+
+    def _flush_receive(self):
+        """
+            Discard received data until the bus is silent for one character, or the flush timeout
+            expired
+        :return: None
+        """
+        char_time = CHAR_BITS / float(self._ser.baudrate)
+        deadline = monotonic() + FLUSH_TIMEOUT
+
+        while True:
+            rx_waiting = self._ser.in_waiting
+            if not rx_waiting:
+                break
+
+            if self._verbose:
+                # Print discarded data
+                print(get_frame_str('RX discarded', self._ser.read(rx_waiting)))
+            else:
+                self._ser.reset_input_buffer()
+
+            self._rx_discarded += rx_waiting
+
+            if monotonic() >= deadline:
+                break
+
+            time.sleep(char_time)
+
+    def _read_fixed_length(self, rx_length):
+        """
+            Read frame with known length in the receive buffer. The address and function are read
+            first, so an exception response is read without waiting for the receive timeout.
+        :param rx_length: Receive length
+        :return: Number of received Bytes
+        """
+        if rx_length <= 2:
+            return self._ser.readinto(self._rx_view[:rx_length])
+
+        rx_count = self._ser.readinto(self._rx_view[:2])
+        if rx_count < 2:
+            return rx_count
+
+        rx_length = get_rx_length(self._rx_buffer, rx_length)
+
+        return rx_count + self._ser.readinto(self._rx_view[2:rx_length])
+
+    def _read_until_silence(self):
+        """
+            Read frame with unknown length in the receive buffer until the bus is silent for the
+            inter-frame delay after the last received Byte
+        :return: Number of received Bytes
+        """
+        char_time = CHAR_BITS / float(self._ser.baudrate)
+        silence = self.frame_delay
+
+        # Wait for the first Byte and stop at a maximum length frame
+        start = monotonic()
+        deadline = start + FRAME_RX_TIMEOUT + (MAX_FRAME_LENGTH * char_time) + silence
+
+        rx_count = 0
+        last_rx_time = None
+        while rx_count < MAX_FRAME_LENGTH:
+            rx_waiting = min(self._ser.in_waiting, MAX_FRAME_LENGTH - rx_count)
+            now = monotonic()
+            if rx_waiting:
+                rx_count += self._ser.readinto(self._rx_view[rx_count:rx_count + rx_waiting])
+                last_rx_time = now
+            elif last_rx_time is not None:
+                if now - last_rx_time >= silence:
+                    # End of frame
+                    break
+            elif now - start >= FRAME_RX_TIMEOUT:
+                # No response
+                break
+
+            if now >= deadline:
+                break
+
+            # Poll once per character
+            time.sleep(char_time)
+
+        return rx_count
+
+    def _wait_bus_idle(self):
+        """
+            Wait remaining delay between frames
+        :return: None
+        """
+        delay = self._bus_idle_time - monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def batch(self, raise_exception=True):
+        """
+            Create batch to collect operations of relay boards on this bus, executed in one pass
+            when leaving the with block:
+                with modbus.batch() as batch:
+                    board1.batch(batch).on(1)
+                    board2.batch(batch).off(3)
+        :param raise_exception: Raise the first operation exception when leaving the with block
+        :return: Batch object
+        """
+        return Batch(self, raise_exception)
 
     def transfer_begin(self):
-        self._lock.acquire()
+        """
+            Lock serial port for a transfer or a sequence of transfers. The lock is reentrant,
+            each call must be followed by transfer_end(). Also available as context manager:
+                with modbus:
+                    modbus.transfer_frame(...)
+        :return: None
+        """
+        if self._lock_owner is threading.current_thread():
+            # Nested lock by the owner
+            self._lock.acquire()
+            self._lock_depth += 1
+            return
+
+        start = monotonic()
+        if not self._lock.acquire(False):
+            self._lock_stats.contended += 1
+            self._lock.acquire()
+        self._lock_time = monotonic()
+
+        self._lock_owner = threading.current_thread()
+        self._lock_depth = 1
+
+        wait_time = self._lock_time - start
+        stats = self._lock_stats
+        stats.acquisitions += 1
+        stats.wait_time += wait_time
+        stats.max_wait_time = max(stats.max_wait_time, wait_time)
 
     def transfer_end(self):
+        """
+            Unlock serial port
+        :return: None
+        """
+        self._lock_depth -= 1
+        if self._lock_depth == 0:
+            hold_time = monotonic() - self._lock_time
+            stats = self._lock_stats
+            stats.hold_time += hold_time
+            stats.max_hold_time = max(stats.max_hold_time, hold_time)
+            self._lock_owner = None
+
         self._lock.release()
 
+    def is_locked_by_current_thread(self):
+        """
+            Check if the serial port is locked by the calling thread
+        :return:
+            True: Locked by the calling thread
+            False: Not locked, or locked by another thread
+        """
+        return self._lock_owner is threading.current_thread()
+
+    def __enter__(self):
+        self.transfer_begin()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.transfer_end()
+        return False
+
     def monitor_start(self, address, blocking=True):
         """
             Snoop and print incoming frames in an endless loop
@@ -397,15 +851,27 @@ class Modbus(object):
             self._monitor_thread.stop()
 
 
+def get_frame_crc(data):
+    """
+        Calculate MODBUS CRC
+    :param data: List data (int), bytes, bytearray or memoryview
+    :return: CRC Bytes in frame order (bytearray)
+    """
+    return crc16_bytes(data)
+
+
 def get_frame_str(msg, data):
     """
         Get frame as string
     :param msg: Message before the data
-    :param data: List data (int)
+    :param data: List data (int), bytes, bytearray or memoryview
     :return: None
     """
     assert type(msg) == str
-    assert type(data) == list
+    assert isinstance(data, (list, bytes, bytearray, memoryview))
+
+    if not isinstance(data, list):
+        data = bytearray(data)
 
     # Print MODBUS frame
     line = '{} {:2d} Bytes: '.format(msg, len(data))
@@ -0,0 +1,512 @@
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+##
+# This module drives the MODBUS transfers of many serial ports from one thread with selectors
+#
+# Source: https://github.com/Erriez/R421A08-rs485-8ch-relay-board
+#
+
+import heapq
+import itertools
+import os
+import selectors
+import threading
+from collections import deque
+
+from . crc import crc16_bytes
+from . framer import Framer, RX_SILENCE, RX_DONE
+from . modbus import serial, monotonic, get_frame_str, check_rx_frame
+from . modbus import DEFAULT_BAUDRATE, DEFAULT_TURNAROUND_DELAY
+from . modbus import SerialOpenException, TransferException
+from . scheduler import Transaction, DeadlineException
+
+# Port states
+STATE_IDLE = 0      # No transaction
+STATE_GAP = 1       # Waiting for the delay between frames
+STATE_TX = 2        # Transmitting frame
+STATE_RX = 3        # Receiving response
+STATE_MONITOR = 4   # Receiving frames of other masters
+
+
+class _Port(object):
+    """ Serial port with the state of the current transaction """
+
+    def __init__(self, serial_port, baud_rate, turnaround_delay, monitor=None):
+        # Non-blocking serial port: Reads and writes return immediately
+        self.ser = serial.Serial()
+        self.ser.port = serial_port
+        self.ser.baudrate = int(baud_rate)
+        self.ser.bytesize = 8
+        self.ser.stopbits = 1
+        self.ser.parity = serial.PARITY_NONE
+        self.ser.timeout = 0
+        self.ser.write_timeout = 0
+
+        self.name = serial_port
+        self.fd = None
+        self.framer = Framer(baud_rate, turnaround_delay)
+        self.monitor = monitor
+
+        self.queue = deque()
+        self.state = STATE_MONITOR if monitor else STATE_IDLE
+        self.transaction = None
+        self.tx_view = None
+
+        # Timers of the current state are ignored after a state change
+        self.generation = 0
+
+
+class Multiplexer(threading.Thread):
+    """ Transfers of many serial ports driven by one thread """
+
+    def __init__(self, verbose=False):
+        """
+            Multiplexer constructor. Serial ports are registered with a selector, which is
+            supported on POSIX systems only.
+        :param verbose: Print transmit and receive frames to console
+        """
+        super(Multiplexer, self).__init__()
+
+        assert type(verbose) == bool
+
+        # Configure as deamon thread to allow exit without stopping the multiplexer
+        self.daemon = True
+
+        self._verbose = verbose
+        self._ports = {}
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+        # Timer queue: (time, sequence, port, generation)
+        self._timers = []
+        self._sequence = itertools.count()
+
+        # Wake up the select call when transactions are submitted by other threads
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_read, False)
+        self._selector.register(self._wakeup_read, selectors.EVENT_READ, None)
+
+    @property
+    def is_stopped(self):
+        """
+           Is stop event generated
+        :return:
+            True: Stop event generated
+            False: No stop event generated
+        """
+        return self._stop_event.is_set()
+
+    @property
+    def serial_ports(self):
+        return list(self._ports)
+
+    def queue_depth(self, serial_port):
+        """
+            Get number of queued transactions of a serial port
+        :param serial_port: Serial port name
+        :return: Number of transactions
+        """
+        with self._lock:
+            return len(self._ports[serial_port].queue)
+
+    def add_port(self, serial_port, baud_rate=DEFAULT_BAUDRATE,
+                 turnaround_delay=DEFAULT_TURNAROUND_DELAY, monitor=None):
+        """
+            Open serial port and add it to the multiplexer
+        :param serial_port: Serial port such as '/dev/ttyUSB0'
+        :param baud_rate: Serial baudrate
+        :param turnaround_delay: Additional delay in seconds between frames for slow USB - RS485
+            dongles
+        :param monitor: Optional function(serial_port, frame) called with every received frame
+            instead of transmitting transactions
+        :return: None
+        """
+        assert serial_port not in self._ports
+
+        port = _Port(serial_port, baud_rate, turnaround_delay, monitor)
+        try:
+            port.ser.open()
+        except serial.SerialException as err:
+            raise SerialOpenException('Error: Cannot open serial port: ' + str(err))
+        port.fd = port.ser.fileno()
+
+        with self._lock:
+            self._ports[serial_port] = port
+            if monitor:
+                self._selector.register(port.fd, selectors.EVENT_READ, port)
+        self._wakeup()
+
+    def submit(self, serial_port, transaction):
+        """
+            Queue transaction on a serial port. Transactions are transmitted in submit order, a
+            transaction with an expired deadline fails with a DeadlineException.
+        :param serial_port: Serial port name
+        :param transaction: relay_modbus.Transaction object
+        :return: Future with the transaction result
+        """
+        assert isinstance(transaction, Transaction)
+
+        with self._lock:
+            if self.is_stopped:
+                raise TransferException('Error: Multiplexer stopped')
+
+            port = self._ports[serial_port]
+            assert not port.monitor
+            transaction.submit_time = monotonic()
+            if transaction.deadline is not None:
+                transaction.expire_time = transaction.submit_time + transaction.deadline
+            port.queue.append(transaction)
+        self._wakeup()
+
+        return transaction.future
+
+    def transfer(self, serial_port, tx_frame, rx_length, parser=None,
+                 append_crc_to_tx_frame=False):
+        """
+            Queue transaction and wait for the result
+        :param serial_port: Serial port name
+        :param tx_frame: Frame data (bytes, bytearray or memoryview)
+        :param rx_length: Receive length, 0 for unknown length
+        :param parser: Optional function to convert the received frame to the result
+        :param append_crc_to_tx_frame: Append CRC to TX frame
+        :return: Transaction result
+        """
+        transaction = Transaction(tx_frame, rx_length, parser, append_crc_to_tx_frame)
+        return self.submit(serial_port, transaction).result()
+
+    def stop(self):
+        """
+            Stop multiplexer thread. Queued transactions fail with a TransferException.
+        :return: None
+        """
+        self._stop_event.set()
+        self._wakeup()
+
+    def _wakeup(self):
+        try:
+            os.write(self._wakeup_write, b'\x00')
+        except OSError:
+            pass
+
+    # ----------------------------------------------------------------------------------------------
+    # Timers
+    # ----------------------------------------------------------------------------------------------
+    def _set_timer(self, port, delay):
+        """
+            Start timer of the current port state
+        :param port: _Port object
+        :param delay: Delay in seconds
+        :return: None
+        """
+        heapq.heappush(self._timers,
+                       (monotonic() + delay, next(self._sequence), port, port.generation))
+
+    def _set_state(self, port, state):
+        """
+            Change port state and cancel timers of the previous state
+        :param port: _Port object
+        :param state: STATE_*
+        :return: None
+        """
+        port.state = state
+        port.generation += 1
+
+    def _run_timers(self):
+        """
+            Handle expired timers
+        :return: Time in seconds until the next timer, None when no timers
+        """
+        while self._timers:
+            expire_time, _, port, generation = self._timers[0]
+            if generation != port.generation:
+                # Timer of a previous state
+                heapq.heappop(self._timers)
+                continue
+
+            now = monotonic()
+            if expire_time > now:
+                return expire_time - now
+
+            heapq.heappop(self._timers)
+            self._on_timer(port)
+
+        return None
+
+    # ----------------------------------------------------------------------------------------------
+    # Port state machine
+    # ----------------------------------------------------------------------------------------------
+    def _start_next(self, port):
+        """
+            Start next queued transaction when the port is idle
+        :param port: _Port object
+        :return: None
+        """
+        if port.state != STATE_IDLE:
+            return
+
+        with self._lock:
+            if not port.queue:
+                return
+            transaction = port.queue.popleft()
+
+        if transaction.expire_time is not None and monotonic() > transaction.expire_time:
+            # Drop stale transaction
+            transaction.fail(DeadlineException('Error: Transaction deadline expired'))
+            self._start_next(port)
+            return
+
+        if not transaction.future.set_running_or_notify_cancel():
+            # Cancelled by the caller
+            self._start_next(port)
+            return
+
+        port.transaction = transaction
+        tx_frame = bytearray(transaction.tx_frame)
+        if transaction.append_crc_to_tx_frame:
+            tx_frame += crc16_bytes(tx_frame)
+        port.tx_view = memoryview(tx_frame)
+
+        delay = port.framer.get_idle_delay()
+        if delay > 0:
+            # Wait for the delay between frames
+            self._set_state(port, STATE_GAP)
+            self._set_timer(port, delay)
+        else:
+            self._transmit(port)
+
+    def _transmit(self, port):
+        """
+            Discard received data and write frame
+        :param port: _Port object
+        :return: None
+        """
+        self._set_state(port, STATE_TX)
+
+        try:
+            port.framer.discard(port.fd, self._verbose)
+        except TransferException as err:
+            self._complete(port, exception=err)
+            return
+
+        if self._verbose:
+            print(get_frame_str('TX', port.tx_view))
+
+        self._write(port)
+
+    def _write(self, port):
+        """
+            Write remaining frame, wait for the port to be writable when the transmit buffer is
+            full
+        :param port: _Port object
+        :return: None
+        """
+        try:
+            tx_count = os.write(port.fd, port.tx_view)
+        except BlockingIOError:
+            tx_count = 0
+        except OSError:
+            self._unregister(port)
+            self._complete(port, exception=TransferException('TX error: Serial write failed'))
+            return
+        port.tx_view = port.tx_view[tx_count:]
+
+        if port.tx_view:
+            self._register(port, selectors.EVENT_WRITE)
+            return
+
+        # Frame written: Next frame after transmitting on the bus and the delay between frames
+        transaction = port.transaction
+        tx_length = len(transaction.tx_frame) + (2 if transaction.append_crc_to_tx_frame else 0)
+
+        if transaction.no_reply:
+            # Fire and forget: Do not transmit during the response of the slave
+            port.framer.transmitted(tx_length, transaction.rx_length)
+            self._unregister(port)
+            self._complete(port, result=None)
+            return
+        port.framer.transmitted(tx_length)
+
+        # Receive response
+        self._set_state(port, STATE_RX)
+        self._register(port, selectors.EVENT_READ)
+        self._set_timer(port, port.framer.start(transaction.rx_length))
+
+    def _register(self, port, events):
+        try:
+            self._selector.modify(port.fd, events, port)
+        except KeyError:
+            self._selector.register(port.fd, events, port)
+
+    def _unregister(self, port):
+        try:
+            self._selector.unregister(port.fd)
+        except KeyError:
+            pass
+
+    def _on_ready(self, port, events):
+        """
+            Handle readable or writable port
+        :param port: _Port object
+        :param events: Selector events
+        :return: None
+        """
+        if port.state == STATE_TX and events & selectors.EVENT_WRITE:
+            self._write(port)
+        elif port.state in (STATE_RX, STATE_MONITOR) and events & selectors.EVENT_READ:
+            self._read(port)
+
+    def _read(self, port):
+        """
+            Read received data
+        :param port: _Port object
+        :return: None
+        """
+        try:
+            rx_state = port.framer.read(port.fd)
+        except TransferException as err:
+            if port.state == STATE_RX:
+                self._unregister(port)
+                self._complete(port, exception=err)
+            return
+
+        if rx_state == RX_DONE:
+            self._end_of_frame(port)
+        elif rx_state == RX_SILENCE:
+            # End of frame when the bus is silent for the delay between frames
+            port.generation += 1
+            self._set_timer(port, port.framer.frame_delay)
+
+    def _on_timer(self, port):
+        """
+            Handle expired timer of the current port state
+        :param port: _Port object
+        :return: None
+        """
+        if port.state == STATE_GAP:
+            self._transmit(port)
+        elif port.state in (STATE_RX, STATE_MONITOR):
+            # Receive timeout or silence after the frame
+            self._end_of_frame(port)
+
+    def _end_of_frame(self, port):
+        """
+            Complete received frame
+        :param port: _Port object
+        :return: None
+        """
+        # Delay next frame from end of receive
+        rx_frame = port.framer.get_frame()
+
+        if port.state == STATE_MONITOR:
+            port.generation += 1
+            if rx_frame:
+                port.monitor(port.name, rx_frame)
+            return
+
+        self._unregister(port)
+
+        if not rx_frame:
+            self._complete(port, exception=TransferException('RX error: Receive timeout'))
+            return
+
+        if self._verbose:
+            print(get_frame_str('RX', rx_frame))
+
+        transaction = port.transaction
+        try:
+            check_rx_frame(rx_frame, transaction.rx_length)
+            if transaction.parser:
+                result = transaction.parser(rx_frame)
+            else:
+                result = rx_frame
+        except Exception as err:
+            self._complete(port, exception=err)
+        else:
+            self._complete(port, result=result)
+
+    def _complete(self, port, result=None, exception=None):
+        """
+            Complete current transaction and start the next transaction
+        :param port: _Port object
+        :param result: Transaction result
+        :param exception: Exception object
+        :return: None
+        """
+        transaction = port.transaction
+        port.transaction = None
+        port.tx_view = None
+        self._set_state(port, STATE_IDLE)
+
+        if exception is not None:
+            transaction.future.set_exception(exception)
+        else:
+            transaction.future.set_result(result)
+
+        self._start_next(port)
+
+    # ----------------------------------------------------------------------------------------------
+    # Multiplexer thread
+    # ----------------------------------------------------------------------------------------------
+    def run(self):
+        """
+            Multiplexer thread
+        :return: None
+        """
+        while not self.is_stopped:
+            for port in list(self._ports.values()):
+                self._start_next(port)
+
+            timeout = self._run_timers()
+
+            for key, events in self._selector.select(timeout):
+                if key.data is None:
+                    # Wake up
+                    try:
+                        os.read(self._wakeup_read, 64)
+                    except BlockingIOError:
+                        pass
+                else:
+                    self._on_ready(key.data, events)
+
+            self._run_timers()
+
+        # Fail current and remaining transactions and close serial ports
+        with self._lock:
+            for port in self._ports.values():
+                # Transaction in progress is running already
+                if port.transaction is not None:
+                    port.transaction.future.set_exception(
+                        TransferException('Error: Multiplexer stopped'))
+                    port.transaction = None
+                for transaction in port.queue:
+                    transaction.fail(TransferException('Error: Multiplexer stopped'))
+                port.queue.clear()
+                self._unregister(port)
+                port.ser.close()
+
+        self._selector.close()
+        os.close(self._wakeup_read)
+        os.close(self._wakeup_write)
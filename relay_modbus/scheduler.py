@@ -0,0 +1,638 @@
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+##
+# This module serializes MODBUS transactions in one bus owner thread
+#
+# Source: https://github.com/Erriez/R421A08-rs485-8ch-relay-board
+#
+
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from . modbus import Modbus, TransferException, monotonic
+
+
+# Transaction priorities, a lower value is executed first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_CONTROL = 1
+PRIORITY_BACKGROUND = 2
+
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_CONTROL, PRIORITY_BACKGROUND)
+
+# Submit behavior when the maximum number of queued transactions is reached
+OVERFLOW_BLOCK = 0          # Wait until a transaction is executed
+OVERFLOW_FAIL = 1           # Raise QueueFullException
+OVERFLOW_DROP_OLDEST = 2    # Drop oldest queued transaction with the lowest priority
+
+
+# Result of the merge function of a queued transaction with a new transaction with the same key
+COALESCE_NONE = 0       # Queue new transaction
+COALESCE_REPLACE = 1    # Replace queued transaction by the returned transaction
+COALESCE_CANCEL = 2     # Remove queued transaction, both complete with the returned result
+COALESCE_ANSWER = 3     # Complete new transaction with the returned function of the queued result
+
+
+class QueueFullException(TransferException):
+    pass
+
+
+class DeadlineException(TransferException):
+    pass
+
+
+class Transaction(object):
+    """ MODBUS transaction: Transmit frame and receive response """
+
+    def __init__(self, tx_frame, rx_length, parser=None, append_crc_to_tx_frame=False,
+                 priority=PRIORITY_CONTROL, deadline=None, key=None, group=None,
+                 operation=None, merge=None, no_reply=False):
+        """
+            Transaction constructor
+        :param tx_frame: Frame data (bytes, bytearray or memoryview)
+        :param rx_length: Receive length, 0 for unknown length
+        :param parser: Optional function to convert the received frame (memoryview) to the
+            result. The received frame is returned as bytes when not specified.
+        :param append_crc_to_tx_frame: Append CRC to TX frame
+        :param priority: PRIORITY_INTERACTIVE, PRIORITY_CONTROL or PRIORITY_BACKGROUND
+        :param deadline: Optional maximum time in seconds between submitting and transmitting.
+            The transaction is dropped with a DeadlineException when it expired in the queue.
+        :param key: Optional target of the transaction, such as (address, relay). A new
+            transaction with the same key is merged with this queued transaction by merge.
+        :param group: Optional group of keys, such as the address. A transaction with a group
+            and without key is not reordered with queued transactions of the same group.
+        :param operation: Optional operation used by merge functions
+        :param merge: Optional function(queued, new) returning a tuple (COALESCE_*, argument)
+        :param no_reply:
+            False: Receive response with rx_length (Default)
+            True: Transmit only, the bus is reserved for a response of rx_length Bytes. The
+                result is None.
+        """
+        assert priority in PRIORITIES
+        assert deadline is None or deadline >= 0
+
+        self.tx_frame = tx_frame
+        self.rx_length = rx_length
+        self.parser = parser
+        self.append_crc_to_tx_frame = append_crc_to_tx_frame
+        self.priority = priority
+        self.deadline = deadline
+        self.key = key
+        self.group = group
+        self.operation = operation
+        self.merge = merge
+        self.no_reply = no_reply
+        self.submit_time = None
+        self.expire_time = None
+        # Transactions answered from the result of this transaction: [(transaction, function)]
+        self.answers = []
+        self.future = Future()
+        self.future.add_done_callback(self._complete_answers)
+
+    def _complete_answers(self, future):
+        """
+            Complete answered transactions, called when the future is done
+        :param future: Future of this transaction
+        :return: None
+        """
+        if future.cancelled() or future.exception() is not None:
+            result = None
+        else:
+            result = future.result()
+
+        answers, self.answers = self.answers, []
+        for transaction, function in answers:
+            if transaction.future.set_running_or_notify_cancel():
+                transaction.future.set_result(function(result))
+
+    def fail(self, exception):
+        """
+            Complete the future with an exception without executing the transaction
+        :param exception: Exception object
+        :return: None
+        """
+        if self.future.set_running_or_notify_cancel():
+            self.future.set_exception(exception)
+
+    def follow(self, transaction):
+        """
+            Complete the future with the result of another transaction
+        :param transaction: Transaction object
+        :return: None
+        """
+        def done(future):
+            if not self.future.set_running_or_notify_cancel():
+                return
+            if future.cancelled():
+                self.future.set_exception(TransferException('Error: Transaction cancelled'))
+            elif future.exception() is not None:
+                self.future.set_exception(future.exception())
+            else:
+                self.future.set_result(future.result())
+
+        transaction.future.add_done_callback(done)
+
+    def execute(self, modbus):
+        """
+            Execute transaction and complete the future with the result or exception
+        :param modbus: Modbus object
+        :return: None
+        """
+        if not self.future.set_running_or_notify_cancel():
+            # Cancelled by the caller
+            return
+
+        try:
+            if self.no_reply:
+                modbus.send_frame(self.tx_frame, self.append_crc_to_tx_frame, self.rx_length)
+                result = None
+            else:
+                rx_frame = modbus.transfer_frame(self.tx_frame,
+                                                 self.append_crc_to_tx_frame,
+                                                 self.rx_length)
+                if self.parser:
+                    result = self.parser(rx_frame)
+                else:
+                    result = bytes(rx_frame)
+        except Exception as err:
+            self.future.set_exception(err)
+        else:
+            self.future.set_result(result)
+
+
+class PriorityStats(object):
+    """ Queue statistics of one transaction priority """
+
+    def __init__(self):
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.transactions = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.expired = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.coalesced = 0
+
+    @property
+    def average_wait_time(self):
+        """
+            Get average time between submitting and executing a transaction
+        :return: Time in seconds
+        """
+        if not self.transactions:
+            return 0.0
+        return self.wait_time / self.transactions
+
+
+class Scheduler(threading.Thread):
+    """ MODBUS bus owner thread executing queued transactions """
+
+    def __init__(self, modbus, max_queue_depth=0, overflow=OVERFLOW_BLOCK, coalesce=True):
+        """
+            Scheduler constructor
+        :param modbus: Modbus object, the scheduler executes all transactions of R421A08 objects
+            using this Modbus object when started
+        :param max_queue_depth: Maximum number of queued transactions of all priorities, 0 for
+            no maximum
+        :param overflow: OVERFLOW_BLOCK, OVERFLOW_FAIL or OVERFLOW_DROP_OLDEST
+        :param coalesce:
+            True: Merge queued transactions with the same key (Default)
+            False: Execute all transactions
+        """
+        super(Scheduler, self).__init__()
+
+        assert type(modbus) == Modbus
+        assert max_queue_depth >= 0
+        assert overflow in (OVERFLOW_BLOCK, OVERFLOW_FAIL, OVERFLOW_DROP_OLDEST)
+
+        # Configure as deamon thread to allow exit without stopping the scheduler
+        self.daemon = True
+
+        self._modbus = modbus
+        self._max_queue_depth = max_queue_depth
+        self._overflow = overflow
+        self._coalesce = bool(coalesce)
+        # Queued transactions with a merge function by key
+        self._pending = {}
+        self._queues = dict((priority, deque()) for priority in PRIORITIES)
+        self._stats = dict((priority, PriorityStats()) for priority in PRIORITIES)
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+
+    @property
+    def is_stopped(self):
+        """
+           Is stop event generated
+        :return:
+            True: Stop event generated
+            False: No stop event generated
+        """
+        return self._stop_event.is_set()
+
+    @property
+    def queue_depth(self):
+        """
+            Get number of queued transactions
+        :return: Number of transactions
+        """
+        return sum(len(queue) for queue in self._queues.values())
+
+    def get_stats(self, priority):
+        """
+            Get queue statistics
+        :param priority: PRIORITY_INTERACTIVE, PRIORITY_CONTROL or PRIORITY_BACKGROUND
+        :return: PriorityStats object
+        """
+        return self._stats[priority]
+
+    def is_worker_thread(self):
+        """
+            Check if called from the scheduler thread
+        :return:
+            True: Called from scheduler thread
+            False: Called from another thread
+        """
+        return threading.current_thread() is self
+
+    def start(self):
+        """
+            Start scheduler thread and route transactions of the Modbus object to the scheduler
+        :return: None
+        """
+        super(Scheduler, self).start()
+        self._modbus.scheduler = self
+
+    def stop(self):
+        """
+            Stop scheduler thread. Queued transactions fail with a TransferException.
+        :return: None
+        """
+        if self._modbus.scheduler is self:
+            self._modbus.scheduler = None
+
+        with self._condition:
+            self._stop_event.set()
+            self._condition.notify_all()
+
+    def submit(self, transaction):
+        """
+            Queue transaction
+        :param transaction: Transaction object
+        :return: Future with the transaction result
+        """
+        assert isinstance(transaction, Transaction)
+
+        with self._condition:
+            if self.is_stopped:
+                raise TransferException('Error: Scheduler stopped')
+
+            transaction.submit_time = monotonic()
+            if transaction.deadline is not None:
+                transaction.expire_time = transaction.submit_time + transaction.deadline
+
+            if self._coalesce and self._merge(transaction):
+                return transaction.future
+
+            if self._max_queue_depth:
+                self._wait_queue_space(transaction.priority)
+
+            self._queue(transaction)
+
+        return transaction.future
+
+    def _queue(self, transaction):
+        """
+            Append submitted transaction to the queue of its priority, called with the condition
+            locked
+        :param transaction: Transaction object
+        :return: None
+        """
+        queue = self._queues[transaction.priority]
+        queue.append(transaction)
+
+        stats = self._stats[transaction.priority]
+        stats.queue_depth = len(queue)
+        stats.max_queue_depth = max(stats.max_queue_depth, stats.queue_depth)
+
+        if self._coalesce:
+            self._add_pending(transaction)
+
+        self._condition.notify_all()
+
+    def _add_pending(self, transaction):
+        """
+            Register queued transaction for merging, called with the condition locked
+        :param transaction: Transaction object
+        :return: None
+        """
+        if transaction.key is not None:
+            if transaction.merge is not None:
+                self._pending[transaction.key] = transaction
+        elif transaction.group is not None:
+            # Later transactions of this group may not be moved before this transaction
+            for key in [key for key, pending in self._pending.items()
+                        if pending.group == transaction.group]:
+                del self._pending[key]
+
+    def _remove_pending(self, transaction):
+        """
+            Unregister transaction removed from the queue, called with the condition locked
+        :param transaction: Transaction object
+        :return: None
+        """
+        if transaction.key is not None and self._pending.get(transaction.key) is transaction:
+            del self._pending[transaction.key]
+
+    def _merge(self, transaction):
+        """
+            Merge new transaction with a queued transaction with the same key, called with the
+            condition locked
+        :param transaction: New transaction object
+        :return:
+            True: Transaction merged, not queued
+            False: Transaction must be queued
+        """
+        pending = self._pending.get(transaction.key) if transaction.key is not None else None
+        if pending is None:
+            return False
+
+        action, argument = pending.merge(pending, transaction)
+        stats = self._stats[transaction.priority]
+
+        if action == COALESCE_REPLACE:
+            # Replace queued transaction at the same position in the queue, or move it to the
+            # queue of the new transaction with a higher priority
+            queue = self._queues[pending.priority]
+            priority = transaction.priority
+            replacement = argument
+            replacement.priority = pending.priority
+            replacement.submit_time = pending.submit_time
+            if replacement.deadline is not None:
+                replacement.expire_time = monotonic() + replacement.deadline
+            queue[queue.index(pending)] = replacement
+            self._promote(replacement, priority)
+            pending.follow(replacement)
+            if replacement is not transaction:
+                transaction.follow(replacement)
+            self._pending[transaction.key] = replacement
+            stats.coalesced += 1
+            self._move_answers(pending)
+        elif action == COALESCE_CANCEL:
+            # Queued and new transaction cancel each other out
+            queue = self._queues[pending.priority]
+            queue.remove(pending)
+            self._stats[pending.priority].queue_depth = len(queue)
+            del self._pending[transaction.key]
+            # Transactions answered from the queued result are executed instead
+            self._move_answers(pending)
+            for cancelled in (pending, transaction):
+                if cancelled.future.set_running_or_notify_cancel():
+                    cancelled.future.set_result(argument)
+            stats.coalesced += 2
+            self._condition.notify_all()
+        elif action == COALESCE_ANSWER:
+            # Answer new transaction from the result of the queued transaction
+            pending.answers.append((transaction, argument))
+            self._promote(pending, transaction.priority)
+            stats.coalesced += 1
+        else:
+            return False
+
+        return True
+
+    def _promote(self, transaction, priority):
+        """
+            Move queued transaction to the end of the queue of a higher priority, called with the
+            condition locked
+        :param transaction: Queued transaction object
+        :param priority: Priority of a transaction merged with the queued transaction
+        :return: None
+        """
+        if priority >= transaction.priority:
+            return
+
+        queue = self._queues[transaction.priority]
+        queue.remove(transaction)
+        self._stats[transaction.priority].queue_depth = len(queue)
+
+        transaction.priority = priority
+        queue = self._queues[priority]
+        queue.append(transaction)
+        stats = self._stats[priority]
+        stats.queue_depth = len(queue)
+        stats.max_queue_depth = max(stats.max_queue_depth, stats.queue_depth)
+
+    def _move_answers(self, pending):
+        """
+            Answer transactions of a replaced or cancelled transaction from the new pending
+            transaction or queue them, called with the condition locked
+        :param pending: Replaced or cancelled transaction
+        :return: None
+        """
+        answers, pending.answers = pending.answers, []
+        for transaction, _ in answers:
+            self._stats[transaction.priority].coalesced -= 1
+            if not self._merge(transaction):
+                self._queue(transaction)
+
+    def _wait_queue_space(self, priority):
+        """
+            Make space for one transaction in the queue, called with the condition locked
+        :param priority: Priority of the new transaction
+        :return: None
+        """
+        while self.queue_depth >= self._max_queue_depth:
+            if self._overflow == OVERFLOW_BLOCK:
+                self._condition.wait()
+                if self.is_stopped:
+                    raise TransferException('Error: Scheduler stopped')
+                continue
+
+            if self._overflow == OVERFLOW_DROP_OLDEST:
+                # Drop oldest transaction with the lowest priority, never a higher priority
+                for drop_priority in reversed(PRIORITIES):
+                    queue = self._queues[drop_priority]
+                    if drop_priority >= priority and queue:
+                        stats = self._stats[drop_priority]
+                        dropped = queue.popleft()
+                        self._remove_pending(dropped)
+                        dropped.fail(QueueFullException('Error: Transaction dropped'))
+                        stats.queue_depth = len(queue)
+                        stats.dropped += 1
+                        break
+                else:
+                    self._stats[priority].rejected += 1
+                    raise QueueFullException('Error: Scheduler queue full')
+            else:
+                self._stats[priority].rejected += 1
+                raise QueueFullException('Error: Scheduler queue full')
+
+    def transfer(self, tx_frame, rx_length, parser=None, append_crc_to_tx_frame=False,
+                 priority=PRIORITY_CONTROL, deadline=None):
+        """
+            Queue transaction and wait for the result
+        :param tx_frame: Frame data (bytes, bytearray or memoryview)
+        :param rx_length: Receive length, 0 for unknown length
+        :param parser: Optional function to convert the received frame to the result
+        :param append_crc_to_tx_frame: Append CRC to TX frame
+        :param priority: PRIORITY_INTERACTIVE, PRIORITY_CONTROL or PRIORITY_BACKGROUND
+        :param deadline: Optional maximum time in seconds between submitting and transmitting
+        :return: Transaction result
+        """
+        transaction = Transaction(tx_frame, rx_length, parser, append_crc_to_tx_frame,
+                                  priority, deadline)
+        return self.submit(transaction).result()
+
+    def _get_transaction(self):
+        """
+            Wait for next transaction with the highest priority. Lower priority transactions
+            wait until all higher priority transactions are executed.
+        :return: Transaction object or None when stopped
+        """
+        with self._condition:
+            while True:
+                while not self.queue_depth and not self.is_stopped:
+                    self._condition.wait()
+
+                if self.is_stopped:
+                    return None
+
+                transaction = self._pop_transaction()
+                if transaction is not None:
+                    return transaction
+
+    def _pop_transaction(self):
+        """
+            Remove next transaction with the highest priority from the queue and drop expired
+            transactions, called with the condition locked
+        :return: Transaction object or None when all queued transactions expired
+        """
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            stats = self._stats[priority]
+            while queue:
+                transaction = queue.popleft()
+                stats.queue_depth = len(queue)
+                self._remove_pending(transaction)
+
+                # Space available for blocked producers
+                self._condition.notify_all()
+
+                now = monotonic()
+                if transaction.expire_time is not None and now > transaction.expire_time:
+                    # Drop stale transaction
+                    transaction.fail(DeadlineException('Error: Transaction deadline expired'))
+                    stats.expired += 1
+                    continue
+
+                wait_time = now - transaction.submit_time
+                stats.transactions += 1
+                stats.wait_time += wait_time
+                stats.max_wait_time = max(stats.max_wait_time, wait_time)
+
+                return transaction
+
+        return None
+
+    def run(self):
+        """
+            Scheduler thread
+        :return: None
+        """
+        while True:
+            transaction = self._get_transaction()
+            if transaction is None:
+                break
+
+            # Lock serial port for other users of the Modbus object, such as the GUI
+            self._modbus.transfer_begin()
+            try:
+                transaction.execute(self._modbus)
+            finally:
+                self._modbus.transfer_end()
+
+        # Fail remaining transactions
+        with self._condition:
+            for priority in PRIORITIES:
+                queue = self._queues[priority]
+                while queue:
+                    queue.popleft().fail(TransferException('Error: Scheduler stopped'))
+                self._stats[priority].queue_depth = 0
+            self._pending.clear()
+
+
+# Lock to start one scheduler per Modbus object
+_start_lock = threading.Lock()
+
+
+def get_scheduler(modbus):
+    """
+        Get scheduler of a Modbus object, started when not running
+    :param modbus: Modbus object
+    :return: Scheduler object
+    """
+    with _start_lock:
+        if modbus.scheduler is None:
+            Scheduler(modbus).start()
+
+        return modbus.scheduler
+
+
+def combine_futures(futures, function):
+    """
+        Combine futures into one future
+    :param futures: List Future objects
+    :param function: Function to convert the list of results to the combined result
+    :return: Future completed with the combined result when all futures are done, or with the
+        first exception
+    """
+    futures = list(futures)
+    combined = Future()
+    combined.set_running_or_notify_cancel()
+    lock = threading.Lock()
+    remaining = [len(futures)]
+
+    def done(future):
+        with lock:
+            if combined.done():
+                return
+            if future.cancelled():
+                combined.set_exception(TransferException('Error: Transaction cancelled'))
+                return
+            if future.exception() is not None:
+                combined.set_exception(future.exception())
+                return
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        combined.set_result(function([future.result() for future in futures]))
+
+    if not futures:
+        combined.set_result(function([]))
+    for future in futures:
+        future.add_done_callback(done)
+
+    return combined
@@ -0,0 +1,137 @@
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+##
+# This module shares one in-flight call between concurrent callers with the same key
+#
+# Source: https://github.com/Erriez/R421A08-rs485-8ch-relay-board
+#
+
+
+import sys
+import threading
+
+from print_stderr import print_stderr
+
+try:
+    from concurrent.futures import Future
+except ImportError:
+    # Python 2.7 requires the backport of concurrent.futures
+    print_stderr('Error: Cannot import concurrent.futures.')
+    print_stderr('To install the futures backport, type:')
+    if sys.platform.startswith('win'):
+        print_stderr('  python.exe -m pip install futures')
+    else:
+        print_stderr('  sudo python -m pip install futures')
+    sys.exit(1)
+
+
+class SingleFlight(object):
+    """ Execute concurrent calls with the same key once and share the result """
+
+    def __init__(self):
+        """
+            SingleFlight constructor
+        """
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._calls = 0
+        self._shared = 0
+
+    @property
+    def calls(self):
+        """
+            Get number of executed calls
+        :return: Number of calls
+        """
+        return self._calls
+
+    @property
+    def shared(self):
+        """
+            Get number of calls answered by the result of another in-flight call
+        :return: Number of calls
+        """
+        return self._shared
+
+    def is_in_flight(self, key):
+        """
+            Check if a call with the key is executing
+        :param key: Call key
+        :return:
+            True: Call executing
+            False: No call executing
+        """
+        with self._lock:
+            return key in self._in_flight
+
+    def do(self, key, function, *args, **kwargs):
+        """
+            Execute function, or wait for the result of the executing call with the same key
+        :param key: Call key, such as (address, 'status')
+        :param function: Function to call
+        :param args: Function arguments
+        :param kwargs: Optional keyword argument wait:
+            True: Wait for the result of an executing call with the same key (Default)
+            False: Never wait for another caller, execute function when a call with the same key
+            is executing. Required when the caller holds a resource the executing call waits for,
+            such as the Modbus lock.
+        :return: Function result, shared with all concurrent callers. Exceptions are raised in
+            all callers.
+        """
+        # Keyword argument after *args for Python 2.7
+        wait = kwargs.pop('wait', True)
+        assert not kwargs
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None and not wait:
+                self._calls += 1
+                owner = None
+            elif future is not None:
+                self._shared += 1
+                owner = False
+            else:
+                future = Future()
+                future.set_running_or_notify_cancel()
+                self._in_flight[key] = future
+                self._calls += 1
+                owner = True
+
+        if owner is None:
+            return function(*args)
+        if not owner:
+            return future.result()
+
+        try:
+            result = function(*args)
+        except Exception as err:
+            future.set_exception(err)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+##
+# R421A08 relay boards emulated on a pseudo terminal to test without hardware (POSIX only)
+#
+
+import os
+import select
+import threading
+import time
+
+try:
+    import tty
+except ImportError:
+    tty = None
+
+from relay_modbus import get_frame_crc
+
+
+# Emulator requires pseudo terminals
+EMULATOR_SUPPORTED = hasattr(os, 'openpty') and tty is not None
+
+
+class BoardEmulator(threading.Thread):
+    """ R421A08 relay boards answering on the slave side of a pseudo terminal """
+
+    def __init__(self, addresses=(1,), status_all=True, whole_board=True, reply_delay=0.002):
+        """
+            BoardEmulator constructor
+        :param addresses: Addresses of the emulated boards
+        :param status_all: Answer read status of multiple relays
+        :param whole_board: Answer whole board on/off commands
+        :param reply_delay: Delay in seconds before responding
+        """
+        super(BoardEmulator, self).__init__()
+        self.daemon = True
+
+        self.relays = {address: [0] * 8 for address in addresses}
+        self.status_all = status_all
+        self.whole_board = whole_board
+        self.reply_delay = reply_delay
+
+        # Received frames
+        self.frames = []
+
+        # Number of next frames not answered, to emulate transient errors
+        self.drop_frames = 0
+
+        # Addresses which do not answer
+        self.silent = set()
+
+        self._master, slave = os.openpty()
+        tty.setraw(self._master)
+        tty.setraw(slave)
+        self.serial_port = os.ttyname(slave)
+        self._slave = slave
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(1)
+        os.close(self._master)
+        os.close(self._slave)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            if not select.select([self._master], [], [], 0.01)[0]:
+                continue
+
+            # End of frame when the bus is silent
+            frame = os.read(self._master, 256)
+            while select.select([self._master], [], [], 0.003)[0]:
+                frame += os.read(self._master, 256)
+
+            response = self._handle_frame(bytearray(frame))
+            if response:
+                time.sleep(self.reply_delay)
+                os.write(self._master, bytes(response + get_frame_crc(response)))
+
+    def _handle_frame(self, frame):
+        """
+            Handle received frame
+        :param frame: Frame including CRC
+        :return: Response without CRC, None when not responding
+        """
+        self.frames.append(bytes(frame))
+
+        if len(frame) < 4 or get_frame_crc(frame[:-2]) != frame[-2:]:
+            return None
+
+        if self.drop_frames:
+            self.drop_frames -= 1
+            return None
+
+        address = frame[0]
+        function = frame[1]
+        if address not in self.relays or address in self.silent:
+            return None
+
+        relays = self.relays[address]
+        relay = (frame[2] << 8) | frame[3]
+        if function == 0x06:
+            cmd = frame[4]
+            if relay == 0:
+                if not self.whole_board or cmd not in (0x07, 0x08):
+                    return bytearray([address, 0x86, 0x03])
+                relays[:] = [1 if cmd == 0x07 else 0] * 8
+            elif cmd in (0x01, 0x05, 0x06):
+                # Momentary and delay commands are not switched off by the emulator
+                relays[relay - 1] = 1
+            elif cmd == 0x02:
+                relays[relay - 1] = 0
+            elif cmd == 0x03:
+                relays[relay - 1] ^= 1
+            elif cmd == 0x04:
+                relays[:] = [0] * 8
+                relays[relay - 1] = 1
+            return frame[:6]
+
+        if function == 0x03:
+            count = (frame[4] << 8) | frame[5]
+            if count > 1 and not self.status_all:
+                return None
+            response = bytearray([address, 0x03, 2 * count])
+            for index in range(relay - 1, relay - 1 + count):
+                response += bytearray([0x00, relays[index]])
+            return response
+
+        return bytearray([address, function | 0x80, 0x01])
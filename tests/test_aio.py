@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import sys
+import unittest
+
+import relay_modbus
+from relay_boards.R421A08 import MAX_FRAME_FAILURES
+
+from . board_emulator import BoardEmulator, EMULATOR_SUPPORTED
+
+if sys.version_info >= (3, 6):
+    import asyncio
+    from relay_modbus.aio import AsyncModbus
+    from relay_boards.aio import AsyncR421A08
+else:
+    AsyncModbus = None
+
+
+# Relay 1 on frame of board 1 without CRC
+CONTROL_FRAME = bytes(bytearray([0x01, 0x06, 0x00, 0x01, 0x01, 0x00]))
+
+# Read status relay 1 frame of board 1 without CRC
+STATUS_FRAME = bytes(bytearray([0x01, 0x03, 0x00, 0x01, 0x00, 0x01]))
+
+
+@unittest.skipUnless(EMULATOR_SUPPORTED and AsyncModbus is not None,
+                     'Pseudo terminals or asyncio not supported')
+class AsyncModbusTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        self.emulator = BoardEmulator(addresses=(1, 2))
+        self.emulator.start()
+
+        self.modbus = AsyncModbus(serial_port=self.emulator.serial_port)
+        self.modbus.open()
+
+    def tearDown(self):
+        self.modbus.close()
+        self.emulator.stop()
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_transfer(self):
+        rx_frame = self.run_async(self.modbus.transfer_frame(CONTROL_FRAME, True, 8))
+
+        self.assertEqual(rx_frame[:6], CONTROL_FRAME)
+        self.assertEqual(self.emulator.relays[1][0], 1)
+
+    def test_transfer_unknown_receive_length(self):
+        self.emulator.relays[1][0] = 1
+
+        rx_frame = self.run_async(self.modbus.transfer_frame(STATUS_FRAME, True, 0))
+
+        self.assertEqual(rx_frame[:5], bytes(bytearray([0x01, 0x03, 0x02, 0x00, 0x01])))
+        self.assertEqual(len(rx_frame), 7)
+
+    def test_slave_exception(self):
+        self.assertRaises(relay_modbus.SlaveException, self.run_async,
+                          self.modbus.transfer_frame(bytes(bytearray([0x01, 0x2B, 0x00])),
+                                                     True, 8))
+
+    def test_receive_timeout(self):
+        self.emulator.silent.add(1)
+
+        self.assertRaises(relay_modbus.TransferException, self.run_async,
+                          self.modbus.transfer_frame(CONTROL_FRAME, True, 8))
+
+        # Next transfer is not disturbed by the timeout
+        self.emulator.silent.clear()
+        rx_frame = self.run_async(self.modbus.transfer_frame(CONTROL_FRAME, True, 8))
+        self.assertEqual(rx_frame[:6], CONTROL_FRAME)
+
+    def test_relay_board(self):
+        board = AsyncR421A08(self.modbus, address=2)
+
+        self.run_async(board.on(3))
+        self.run_async(board.toggle(4))
+
+        self.assertEqual(self.run_async(board.get_status(3)), 1)
+        self.assertEqual(self.run_async(board.get_status_mask()), 0x0C)
+        self.assertEqual(self.emulator.relays[1], [0] * 8)
+
+    def test_status_all_not_supported(self):
+        self.emulator.status_all = False
+        board = AsyncR421A08(self.modbus, address=1)
+        self.emulator.relays[1][1] = 1
+
+        for _ in range(MAX_FRAME_FAILURES):
+            self.assertEqual(self.run_async(board.get_status_mask()), 0x02)
+        self.assertFalse(board.status_all_supported)
+
+        # Read status per relay only
+        self.emulator.frames[:] = []
+        self.assertEqual(self.run_async(board.get_status_mask()), 0x02)
+        self.assertEqual(len(self.emulator.frames), 8)
+
+    def test_status_all_transient(self):
+        board = AsyncR421A08(self.modbus, address=1)
+
+        self.emulator.drop_frames = 1
+        self.assertEqual(self.run_async(board.get_status_mask()), 0x00)
+        self.assertTrue(board.status_all_supported)
+
+    def test_whole_board_rejected(self):
+        self.emulator.whole_board = False
+        board = AsyncR421A08(self.modbus, address=1)
+
+        self.run_async(board.on_all())
+
+        self.assertEqual(self.emulator.relays[1], [1] * 8)
+        self.assertFalse(board.whole_board_supported)
+
+        # Turn relays off per relay only
+        self.emulator.frames[:] = []
+        self.run_async(board.off_all())
+        self.assertEqual(self.emulator.relays[1], [0] * 8)
+        self.assertEqual(len(self.emulator.frames), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
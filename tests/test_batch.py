@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+import unittest
+
+import relay_modbus
+
+
+class Target(object):
+    """ Batch target recording the flushed operations """
+
+    def __init__(self, batch_key, flushed):
+        self.batch_key = batch_key
+        self._flushed = flushed
+
+    def flush_batch(self, operations):
+        for operation in operations:
+            self._flushed.append((self.batch_key, operation.name))
+            if operation.name == 'fail':
+                operation.set_exception(relay_modbus.TransferException('Error'))
+            else:
+                operation.set_result(operation.args)
+
+
+class BatchTest(unittest.TestCase):
+    def test_flush_order(self):
+        flushed = []
+        targets = [Target(('COM2', 1), flushed), Target(('COM1', 2), flushed),
+                   Target(('COM1', 1), flushed)]
+        batch = relay_modbus.Batch()
+
+        operations = [batch.add(targets[0], 'a', 1), batch.add(targets[1], 'b', 2),
+                      batch.add(targets[2], 'c', 3), batch.add(targets[0], 'd', 4)]
+        self.assertEqual(batch.flush(), [(1,), (2,), (3,), (4,)])
+
+        # Targets ordered by batch_key, operations of a target in recording order
+        self.assertEqual(flushed, [(('COM1', 1), 'c'), (('COM1', 2), 'b'),
+                                   (('COM2', 1), 'a'), (('COM2', 1), 'd')])
+        self.assertTrue(all(operation.done for operation in operations))
+        self.assertEqual(batch.operations, [])
+
+    def test_exception_result(self):
+        batch = relay_modbus.Batch(raise_exception=False)
+        target = Target(1, [])
+
+        operation = batch.add(target, 'fail')
+        self.assertEqual(batch.flush(), [None])
+        self.assertIsInstance(operation.exception, relay_modbus.TransferException)
+
+    def test_exception_raised(self):
+        flushed = []
+
+        # First exception raised after all operations are executed
+        with self.assertRaises(relay_modbus.TransferException):
+            with relay_modbus.Batch() as batch:
+                failed = batch.add(Target(2, flushed), 'fail')
+                executed = batch.add(Target(1, flushed), 'a')
+        self.assertEqual(flushed, [(1, 'a'), (2, 'fail')])
+        self.assertTrue(failed.done)
+        self.assertTrue(executed.done)
+
+    def test_with_block(self):
+        flushed = []
+        with relay_modbus.Batch() as batch:
+            batch.add(Target(1, flushed), 'a')
+            self.assertEqual(flushed, [])
+        self.assertEqual(flushed, [(1, 'a')])
+
+        # Operations discarded when the with block raises an exception
+        try:
+            with relay_modbus.Batch() as batch:
+                batch.add(Target(1, flushed), 'b')
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(flushed, [(1, 'a')])
@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+import threading
+import time
+import unittest
+
+import relay_boards
+
+
+class Board(object):
+    """ Relay board on a serial port which takes some time per transfer """
+
+    def __init__(self, serial_port, address, delay=0.1):
+        self.serial_port = serial_port
+        self.address = address
+        self.delay = delay
+        self.threads = []
+
+    def get_status_mask(self):
+        self.threads.append(threading.current_thread())
+        time.sleep(self.delay)
+        return self.address
+
+
+class BusExecutorTest(unittest.TestCase):
+    def test_buses_concurrent(self):
+        boards = [Board('/dev/ttyUSB{}'.format(port), address)
+                  for port in range(4) for address in (1, 2)]
+
+        with relay_boards.BusExecutor(boards) as executor:
+            self.assertEqual(len(executor.serial_ports), 4)
+
+            start_time = time.time()
+            masks = executor.get_status_mask()
+            duration = time.time() - start_time
+
+        # Two sequential boards per bus, buses in parallel
+        self.assertLess(duration, 0.35)
+        self.assertEqual(masks, {(board.serial_port, board.address): board.address
+                                 for board in boards})
+
+        # Boards of one bus share one worker thread
+        for port in range(4):
+            self.assertIs(boards[port * 2].threads[0], boards[port * 2 + 1].threads[0])
+
+    def test_bus_exception(self):
+        def fail(boards):
+            if boards[0].serial_port == 'COM2':
+                raise IOError('Bus failure')
+            time.sleep(0.05)
+            completed.append(boards[0].serial_port)
+
+        completed = []
+        with relay_boards.BusExecutor([Board('COM1', 1), Board('COM2', 1)]) as executor:
+            self.assertRaises(IOError, executor.run, fail)
+
+        # Other buses completed before the exception is raised
+        self.assertEqual(completed, ['COM1'])
+
@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import unittest
+
+import relay_modbus
+from relay_modbus.modbus import CRC_HI, CRC_LOW
+
+
+def crc_reference(data):
+    crc_high = 0xFF
+    crc_low = 0xFF
+
+    for byte in data:
+        index = crc_high ^ byte
+        crc_high = crc_low ^ CRC_HI[index]
+        crc_low = CRC_LOW[index]
+
+    return [crc_high, crc_low]
+
+
+class CrcTest(unittest.TestCase):
+    def test_crc_tables(self):
+        for data in range(0, 256):
+            self.assertListEqual(list(relay_modbus.crc16_bytes([data])), crc_reference([data]))
+            for data_next in [0x00, 0x55, 0xAA, 0xFF]:
+                self.assertListEqual(list(relay_modbus.crc16_bytes([data, data_next])),
+                                     crc_reference([data, data_next]))
+
+    def test_crc16(self):
+        self.assertEqual(relay_modbus.crc16(b''), 0xFFFF)
+        self.assertEqual(relay_modbus.crc16(b'\x00'), 0x40BF)
+        self.assertEqual(relay_modbus.crc16(bytearray([0x12, 0x34, 0x56, 0x67])), 0xD83A)
+        self.assertEqual(relay_modbus.crc16(memoryview(b'\x12\x34\x56\x67\x3A\xD8')), 0x0000)
+        self.assertEqual(relay_modbus.crc16([0x01, 0x06, 0x00, 0x01, 0x01, 0x00]), 0x9AD9)
+
+    def test_crc16_check(self):
+        self.assertTrue(relay_modbus.crc16_check(b'\x01\x06\x00\x01\x01\x00\xD9\x9A'))
+        self.assertFalse(relay_modbus.crc16_check(b'\x01\x06\x00\x01\x01\x00\xD9\x9B'))
+        self.assertFalse(relay_modbus.crc16_check(b'\xFF\xFF'))
+
+    def test_crc16_incremental(self):
+        frame = b'\x01\x03\x10\x00\x01\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x01'
+
+        crc = relay_modbus.Crc16()
+        for i in range(0, len(frame), 3):
+            crc.update(frame[i:i + 3])
+        self.assertEqual(crc.value, relay_modbus.crc16(frame))
+        self.assertEqual(crc.digest(), bytes(relay_modbus.crc16_bytes(frame)))
+
+        crc_copy = crc.copy()
+        crc_copy.update(crc.digest())
+        self.assertEqual(crc_copy.value, 0x0000)
+
+        crc.reset()
+        self.assertEqual(crc.value, 0xFFFF)
+
+    def test_crc16_batch(self):
+        frames = [b'', b'\x00', b'\x12\x34\x56\x67', b'\x01\x06\x00\x01\x01\x00']
+        self.assertListEqual(relay_modbus.crc16_batch(frames),
+                             [relay_modbus.crc16(frame) for frame in frames])
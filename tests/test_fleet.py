@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+import unittest
+
+from relay_boards.fleet import Fleet
+from relay_boards.R421A08 import CMD_ON, CMD_OFF, CMD_LATCH, CMD_ON_ALL, CMD_OFF_ALL
+
+
+class FleetTest(unittest.TestCase):
+    def setUp(self):
+        self.fleet = Fleet(capacity=2)
+        for port in ['/dev/ttyUSB0', '/dev/ttyUSB1']:
+            for address in range(1, 4):
+                self.fleet.add_board(port, address)
+                self.fleet.set_observed_mask(port, address, 0x00)
+
+    def test_add_board(self):
+        self.assertEqual(self.fleet.num_boards, 6)
+        self.assertEqual(self.fleet.add_board('/dev/ttyUSB0', 2), 1)
+        self.assertEqual(self.fleet.get_index('/dev/ttyUSB1', 1), 3)
+        self.assertListEqual(self.fleet.ports, ['/dev/ttyUSB0', '/dev/ttyUSB1'])
+
+    def test_no_changes(self):
+        self.assertEqual(int(self.fleet.get_diff().sum()), 0)
+        self.assertDictEqual(self.fleet.count_changes(), {'/dev/ttyUSB0': 0, '/dev/ttyUSB1': 0})
+        self.assertDictEqual(self.fleet.get_commands(), {'/dev/ttyUSB0': [], '/dev/ttyUSB1': []})
+
+    def test_single_relays(self):
+        self.fleet.set_desired('/dev/ttyUSB0', 2, 3, 1)
+        self.fleet.set_desired('/dev/ttyUSB1', 3, 8, 1)
+        self.fleet.set_observed('/dev/ttyUSB1', 1, 5, 1)
+
+        self.assertDictEqual(self.fleet.count_changes(), {'/dev/ttyUSB0': 1, '/dev/ttyUSB1': 2})
+        self.assertDictEqual(self.fleet.get_commands(),
+                             {'/dev/ttyUSB0': [(2, 3, CMD_ON)],
+                              '/dev/ttyUSB1': [(1, 5, CMD_OFF), (3, 8, CMD_ON)]})
+
+    def test_board_frames(self):
+        self.fleet.set_desired_mask('/dev/ttyUSB0', 1, 0xFF)
+        self.fleet.set_desired_mask('/dev/ttyUSB0', 2, 0x20)
+        self.fleet.set_observed_mask('/dev/ttyUSB0', 2, 0x03)
+        self.fleet.set_observed_mask('/dev/ttyUSB1', 2, 0x81)
+
+        self.assertDictEqual(self.fleet.get_commands(),
+                             {'/dev/ttyUSB0': [(1, 0, CMD_ON_ALL), (2, 6, CMD_LATCH)],
+                              '/dev/ttyUSB1': [(2, 0, CMD_OFF_ALL)]})
+
+    def test_unknown_state(self):
+        self.fleet.set_observed_mask('/dev/ttyUSB0', 3, -1)
+        self.fleet.set_desired_mask('/dev/ttyUSB0', 3, 0x01)
+
+        self.assertDictEqual(self.fleet.count_changes(), {'/dev/ttyUSB0': 8, '/dev/ttyUSB1': 0})
+        self.assertListEqual(self.fleet.get_commands()['/dev/ttyUSB0'], [(3, 1, CMD_LATCH)])
@@ -135,6 +135,32 @@ class RelayBoardOffTest(unittest.TestCase):
                              'TX  8 Bytes:  01 06 00 01 01 00 D9 9A\n'
                              'RX  8 Bytes:  01 06 00 01 01 00 D9 9A')
 
+    def test_transfer_unknown_receive_length(self):
+        modbus_test = relay_modbus.Modbus(self._serial_port, verbose=False)
+        modbus_test.open()
+
+        tx_data = [0x01, 0x06, 0x00, 0x01, 0x02, 0x00, 0xD9, 0x6A]
+
+        rx_data = modbus_test.transfer(list(tx_data), append_crc_to_tx_frame=False, rx_length=0)
+
+        self.assertListEqual(tx_data, rx_data)
+
+    def test_transfer_lock(self):
+        modbus_test = relay_modbus.Modbus(self._serial_port, verbose=False)
+        modbus_test.open()
+
+        tx_data = [0x01, 0x06, 0x00, 0x01, 0x02, 0x00, 0xD9, 0x6A]
+
+        with modbus_test:
+            self.assertTrue(modbus_test.is_locked_by_current_thread())
+            rx_data = modbus_test.transfer(list(tx_data), append_crc_to_tx_frame=False,
+                                           rx_length=8)
+        self.assertFalse(modbus_test.is_locked_by_current_thread())
+
+        self.assertListEqual(tx_data, rx_data)
+        self.assertEqual(modbus_test.lock_stats.acquisitions, 1)
+        self.assertGreater(modbus_test.lock_stats.hold_time, 0.0)
+
     def test_receive_timeout(self):
         modbus_test = relay_modbus.Modbus(self._serial_port, verbose=False)
         modbus_test.open()
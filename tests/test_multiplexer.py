@@ -0,0 +1,165 @@
+#!/usr/bin/python3
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+import os
+import time
+import unittest
+
+import relay_modbus
+from relay_modbus.multiplexer import Multiplexer
+
+from . board_emulator import BoardEmulator, EMULATOR_SUPPORTED
+
+try:
+    import tty
+except ImportError:
+    tty = None
+
+
+# Relay 1 on frame of board 1 without CRC
+CONTROL_FRAME = bytes(bytearray([0x01, 0x06, 0x00, 0x01, 0x01, 0x00]))
+
+# Read status relay 1 frame of board 1 without CRC
+STATUS_FRAME = bytes(bytearray([0x01, 0x03, 0x00, 0x01, 0x00, 0x01]))
+
+
+@unittest.skipUnless(EMULATOR_SUPPORTED, 'Pseudo terminals not supported')
+class MultiplexerTest(unittest.TestCase):
+    def setUp(self):
+        self.emulators = [BoardEmulator(addresses=(1,)), BoardEmulator(addresses=(1,))]
+        self.multiplexer = Multiplexer()
+        for emulator in self.emulators:
+            emulator.start()
+            self.multiplexer.add_port(emulator.serial_port)
+        self.multiplexer.start()
+
+    def tearDown(self):
+        self.multiplexer.stop()
+        self.multiplexer.join(1.0)
+        for emulator in self.emulators:
+            emulator.stop()
+
+    def test_transfer(self):
+        futures = []
+        for emulator in self.emulators:
+            futures.append(self.multiplexer.submit(
+                emulator.serial_port,
+                relay_modbus.Transaction(CONTROL_FRAME, 8, append_crc_to_tx_frame=True)))
+
+        for future in futures:
+            self.assertEqual(future.result(1.0)[:6], CONTROL_FRAME)
+        for emulator in self.emulators:
+            self.assertEqual(emulator.relays[1][0], 1)
+
+    def test_transfer_parser(self):
+        result = self.multiplexer.transfer(self.emulators[0].serial_port, CONTROL_FRAME, 8,
+                                           parser=lambda rx_frame: rx_frame[4],
+                                           append_crc_to_tx_frame=True)
+        self.assertEqual(result, 0x01)
+
+    def test_transfer_unknown_receive_length(self):
+        self.emulators[0].relays[1][0] = 1
+
+        rx_frame = self.multiplexer.transfer(self.emulators[0].serial_port, STATUS_FRAME, 0,
+                                             append_crc_to_tx_frame=True)
+
+        self.assertEqual(rx_frame[:5], bytes(bytearray([0x01, 0x03, 0x02, 0x00, 0x01])))
+        self.assertEqual(len(rx_frame), 7)
+
+    def test_slave_exception(self):
+        self.assertRaises(relay_modbus.SlaveException, self.multiplexer.transfer,
+                          self.emulators[0].serial_port, bytes(bytearray([0x01, 0x2B, 0x00])), 8,
+                          append_crc_to_tx_frame=True)
+
+    def test_receive_timeout(self):
+        self.emulators[0].silent.add(1)
+
+        self.assertRaises(relay_modbus.TransferException, self.multiplexer.transfer,
+                          self.emulators[0].serial_port, CONTROL_FRAME, 8,
+                          append_crc_to_tx_frame=True)
+
+    def test_deadline(self):
+        serial_port = self.emulators[0].serial_port
+        self.emulators[0].silent.add(1)
+
+        # Second transaction expires while the first transaction waits for the receive timeout
+        futures = [
+            self.multiplexer.submit(serial_port, relay_modbus.Transaction(
+                CONTROL_FRAME, 8, append_crc_to_tx_frame=True)),
+            self.multiplexer.submit(serial_port, relay_modbus.Transaction(
+                CONTROL_FRAME, 8, append_crc_to_tx_frame=True, deadline=0.01))]
+
+        self.assertRaises(relay_modbus.TransferException, futures[0].result, 1.0)
+        self.assertRaises(relay_modbus.DeadlineException, futures[1].result, 1.0)
+        self.assertEqual(len(self.emulators[0].frames), 1)
+
+    def test_stop_while_busy(self):
+        serial_port = self.emulators[0].serial_port
+        self.emulators[0].silent.add(1)
+
+        futures = [self.multiplexer.submit(serial_port, relay_modbus.Transaction(
+            CONTROL_FRAME, 8, append_crc_to_tx_frame=True)) for _ in range(2)]
+
+        # Wait for the first transaction waiting for a response
+        while not futures[0].running():
+            time.sleep(0.001)
+        self.multiplexer.stop()
+        self.multiplexer.join(1.0)
+
+        self.assertFalse(self.multiplexer.is_alive())
+        for future in futures:
+            self.assertRaises(relay_modbus.TransferException, future.result, 1.0)
+        self.assertRaises(relay_modbus.TransferException, self.multiplexer.submit, serial_port,
+                          relay_modbus.Transaction(CONTROL_FRAME, 8))
+
+
+@unittest.skipUnless(EMULATOR_SUPPORTED, 'Pseudo terminals not supported')
+class MultiplexerMonitorTest(unittest.TestCase):
+    def test_monitor(self):
+        master, slave = os.openpty()
+        tty.setraw(master)
+        tty.setraw(slave)
+        frames = []
+
+        multiplexer = Multiplexer()
+        multiplexer.add_port(os.ttyname(slave),
+                             monitor=lambda serial_port, frame: frames.append(frame))
+        multiplexer.start()
+        try:
+            # Frames are separated by silence on the bus
+            os.write(master, CONTROL_FRAME)
+            time.sleep(0.1)
+            os.write(master, STATUS_FRAME[:3])
+            time.sleep(0.001)
+            os.write(master, STATUS_FRAME[3:])
+            time.sleep(0.1)
+        finally:
+            multiplexer.stop()
+            multiplexer.join(1.0)
+            os.close(master)
+            os.close(slave)
+
+        self.assertEqual(frames, [CONTROL_FRAME, STATUS_FRAME])
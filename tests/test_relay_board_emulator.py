@@ -0,0 +1,276 @@
+#!/usr/bin/python3
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+import threading
+import time
+import unittest
+
+import relay_boards
+import relay_modbus
+from relay_boards.R421A08 import OPERATION_READ_STATUS, RELAY_ALL, MAX_FRAME_FAILURES
+from relay_boards.R421A08 import CMD_ON, CMD_OFF, CMD_TOGGLE, CMD_LATCH, CMD_MOMENTARY, CMD_DELAY
+from relay_boards.R421A08 import CMD_ON_ALL, CMD_OFF_ALL
+
+from . board_emulator import BoardEmulator, EMULATOR_SUPPORTED
+
+
+@unittest.skipUnless(EMULATOR_SUPPORTED, 'Pseudo terminals not supported')
+class RelayBoardEmulatorTest(unittest.TestCase):
+    def setUp(self):
+        self.emulator = BoardEmulator(addresses=(1, 2))
+        self.emulator.start()
+        self.modbus = relay_modbus.Modbus(self.emulator.serial_port)
+        self.modbus.open()
+
+    def tearDown(self):
+        self.modbus.close()
+        self.emulator.stop()
+
+    def test_read_status_lock_holder_not_shared(self):
+        board = relay_boards.R421A08(self.modbus, 1)
+        key = (1, OPERATION_READ_STATUS, RELAY_ALL)
+        results = []
+
+        def read_locked():
+            with self.modbus:
+                # Executing read of another thread waits for the lock of this thread
+                reader.start()
+                while not self.modbus.single_flight.is_in_flight(key):
+                    time.sleep(0.001)
+                results.append(board.get_status_all())
+
+        reader = threading.Thread(target=lambda: results.append(board.get_status_all()))
+        lock_holder = threading.Thread(target=read_locked)
+        lock_holder.daemon = reader.daemon = True
+        lock_holder.start()
+        lock_holder.join(2.0)
+        reader.join(2.0)
+
+        self.assertFalse(lock_holder.is_alive())
+        self.assertFalse(reader.is_alive())
+        self.assertEqual(results, [{relay: 0 for relay in range(1, 9)}] * 2)
+
+    def test_cache_address_change(self):
+        board = relay_boards.R421A08(self.modbus, 1, cache_ttl=10.0)
+        self.assertTrue(board.on(1))
+        self.assertEqual(board.get_status(1), 1)
+        self.assertEqual(board.cache_hits, 1)
+
+        # Shadow state of board 1 is not used for board 2
+        board.address = 2
+        self.assertEqual(board.get_status(1), 0)
+        self.assertEqual(board.cache_hits, 0)
+
+    def test_cache_toggle_expired(self):
+        board = relay_boards.R421A08(self.modbus, 1, cache_ttl=0.05)
+        self.assertTrue(board.on(1))
+
+        # Relay switched by another master after the state expired
+        time.sleep(0.1)
+        self.emulator.relays[1][0] = 0
+        self.assertTrue(board.toggle(1))
+        self.assertEqual(board.get_status(1), 1)
+        self.assertEqual(self.emulator.relays[1][0], 1)
+
+        # Known state is toggled without reading the board
+        frames = len(self.emulator.frames)
+        self.assertTrue(board.toggle(1))
+        self.assertEqual(board.get_status(1), 0)
+        self.assertEqual(len(self.emulator.frames), frames + 1)
+
+    def test_off_all_boards_verify(self):
+        boards = [relay_boards.R421A08(self.modbus, address) for address in (3, 1, 2)]
+        self.emulator.relays[1] = [1] * 8
+        self.emulator.relays[2] = [1] * 8
+
+        # Board 3 does not exist: Remaining boards are verified
+        self.assertFalse(relay_boards.off_all_boards(boards, verify=True))
+        self.assertEqual(self.emulator.relays[1], [0] * 8)
+        self.assertEqual(self.emulator.relays[2], [0] * 8)
+
+        self.assertTrue(relay_boards.off_all_boards(boards[1:], verify=True))
+
+    def test_off_all_boards_reply_delay(self):
+        boards = [relay_boards.R421A08(self.modbus, address) for address in (1, 2)]
+        self.emulator.relays[1] = [1] * 8
+        self.modbus.reply_delay = 0.1
+
+        # Bus reserved for the response of each board and the reply delay
+        start = time.time()
+        self.assertTrue(relay_boards.off_all_boards(boards))
+        self.assertEqual(boards[0].get_status_mask(), 0)
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+    def test_status_all_transient_failure(self):
+        board = relay_boards.R421A08(self.modbus, 1)
+
+        # Read status all relays not answered once: Single relay reads
+        self.emulator.drop_frames = 1
+        self.assertEqual(board.get_status_mask(), 0)
+        self.assertTrue(board.status_all_supported)
+
+    def test_status_all_not_supported(self):
+        board = relay_boards.R421A08(self.modbus, 1)
+        self.emulator.status_all = False
+
+        for _ in range(MAX_FRAME_FAILURES):
+            self.assertTrue(board.status_all_supported)
+            self.assertEqual(board.get_status_mask(), 0)
+        self.assertFalse(board.status_all_supported)
+
+    def test_whole_board_transient_failure(self):
+        board = relay_boards.R421A08(self.modbus, 1)
+
+        # Whole board command not answered once: Single relay commands
+        self.emulator.drop_frames = 1
+        self.assertTrue(board.on_all())
+        self.assertEqual(self.emulator.relays[1], [1] * 8)
+        self.assertTrue(board.whole_board_supported)
+
+    def test_whole_board_rejected(self):
+        board = relay_boards.R421A08(self.modbus, 1)
+        self.emulator.whole_board = False
+
+        self.assertTrue(board.on_all())
+        self.assertEqual(self.emulator.relays[1], [1] * 8)
+        self.assertFalse(board.whole_board_supported)
+
+    def get_commands(self, frames):
+        # Relay and command of the control frames
+        return [(frame[3], frame[4]) for frame in frames if frame[1] == 0x06]
+
+    def test_apply_changed_relays(self):
+        board = relay_boards.R421A08(self.modbus, 1)
+        self.emulator.relays[1] = [1, 0, 1, 0, 0, 0, 0, 0]
+
+        self.assertTrue(board.apply(0b00000110))
+
+        # One read status all relays, only relay 1 and 2 switched
+        self.assertEqual(len(self.emulator.frames), 3)
+        self.assertEqual(self.get_commands(self.emulator.frames), [(1, CMD_OFF), (2, CMD_ON)])
+        self.assertEqual(self.emulator.relays[1], [0, 1, 1, 0, 0, 0, 0, 0])
+
+        # No changes
+        self.assertTrue(board.apply(0b00000110))
+        self.assertEqual(len(self.emulator.frames), 4)
+
+    def test_apply_shortcuts(self):
+        board = relay_boards.R421A08(self.modbus, 1, cache_ttl=10.0)
+        self.emulator.relays[1] = [1, 0, 1, 0, 1, 0, 1, 0]
+
+        # Whole board on/off, single relay with latch when multiple relays change
+        for mask, commands in ((0xFF, [(RELAY_ALL, CMD_ON_ALL)]),
+                               (0x00, [(RELAY_ALL, CMD_OFF_ALL)]),
+                               (0x03, [(1, CMD_ON), (2, CMD_ON)]),
+                               (0x04, [(3, CMD_LATCH)])):
+            frames = len(self.emulator.frames)
+            self.assertTrue(board.apply(mask))
+            self.assertEqual(self.get_commands(self.emulator.frames[frames:]), commands)
+            self.assertEqual(board.get_status_mask(), mask)
+
+        # Shadow state used after the first read
+        self.assertEqual(len(self.emulator.frames), 6)
+        self.assertEqual(self.emulator.relays[1], [0, 0, 1, 0, 0, 0, 0, 0])
+
+    def test_apply_dict(self):
+        board = relay_boards.R421A08(self.modbus, 1)
+        self.emulator.relays[1] = [1, 0, 1, 0, 0, 0, 0, 0]
+
+        self.assertTrue(board.apply_dict({1: 1, 2: 1, 3: 0}))
+
+        # Relay 1 unchanged, other relays keep their state
+        self.assertEqual(self.get_commands(self.emulator.frames), [(2, CMD_ON), (3, CMD_OFF)])
+        self.assertEqual(self.emulator.relays[1], [1, 1, 0, 0, 0, 0, 0, 0])
+
+    def test_batch_toggle_parity(self):
+        board = relay_boards.R421A08(self.modbus, 1)
+
+        with board.batch() as batch:
+            cancelled = [batch.toggle(1), batch.toggle(1)]
+            toggled = [batch.toggle(2) for _ in range(3)]
+
+        # Two toggles cancel out, three toggles are one toggle
+        self.assertEqual(self.get_commands(self.emulator.frames), [(2, CMD_TOGGLE)])
+        self.assertEqual(self.emulator.relays[1][:2], [0, 1])
+        self.assertEqual([operation.result for operation in cancelled + toggled], [True] * 5)
+
+    def test_batch_latch(self):
+        board = relay_boards.R421A08(self.modbus, 1)
+
+        with board.batch() as batch:
+            batch.on(1)
+            batch.on(2)
+            batch.latch(3)
+
+        # Latch resets the relays switched before
+        self.assertEqual(self.get_commands(self.emulator.frames), [(3, CMD_LATCH)])
+        self.assertEqual(self.emulator.relays[1], [0, 0, 1, 0, 0, 0, 0, 0])
+
+    def test_batch_timed_segments(self):
+        board = relay_boards.R421A08(self.modbus, 1)
+
+        with board.batch() as batch:
+            batch.on(1)
+            batch.momentary(2)
+            batch.off(1)
+            batch.delay(3, 5)
+            batch.on(1)
+
+        # Momentary and delay commands are not merged with commands around them
+        self.assertEqual(self.get_commands(self.emulator.frames),
+                         [(1, CMD_ON), (2, CMD_MOMENTARY), (1, CMD_OFF), (3, CMD_DELAY),
+                          (1, CMD_ON)])
+
+    def test_batch_boards_ordered(self):
+        boards = [relay_boards.R421A08(self.modbus, address) for address in (2, 1)]
+
+        with self.modbus.batch() as batch:
+            for board in boards:
+                board.batch(batch).on(1)
+
+        self.assertEqual([frame[0] for frame in self.emulator.frames], [1, 2])
+
+    def test_batch_operation_results(self):
+        board = relay_boards.R421A08(self.modbus, 1, cache_ttl=10.0)
+        self.assertTrue(board.off(2))
+        self.emulator.drop_frames = 1
+
+        with board.batch(raise_exception=False) as batch:
+            failed = batch.on(1)
+            unchanged = batch.off(2)
+
+        # Relay 2 needs no frame, the frame of relay 1 is not answered
+        self.assertIsInstance(failed.exception, relay_modbus.TransferException)
+        self.assertTrue(unchanged.result)
+        self.assertIsNone(unchanged.exception)
+
+    def test_batch_exception(self):
+        board = relay_boards.R421A08(self.modbus, 3)
+
+        # Board does not answer: Raised like commands without a batch
+        with self.assertRaises(relay_modbus.TransferException):
+            with board.batch() as batch:
+                batch.on(1)
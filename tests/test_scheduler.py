@@ -0,0 +1,319 @@
+#!/usr/bin/python3
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+import threading
+import time
+import unittest
+from concurrent.futures import Future
+
+import relay_boards
+import relay_modbus
+from relay_boards.R421A08 import CMD_ON, CMD_OFF, CMD_TOGGLE
+
+from . board_emulator import BoardEmulator, EMULATOR_SUPPORTED
+
+
+def control_frame(relay, cmd=CMD_ON):
+    # Control frame of board 1 without CRC
+    return bytes(bytearray([0x01, 0x06, 0x00, relay, cmd, 0x00]))
+
+
+def merge_with(action, argument=None):
+    # Merge function returning a fixed action
+    return lambda pending, transaction: (action, argument)
+
+
+@unittest.skipUnless(EMULATOR_SUPPORTED, 'Pseudo terminals not supported')
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.emulator = BoardEmulator(addresses=(1,))
+        self.emulator.start()
+        self.modbus = relay_modbus.Modbus(self.emulator.serial_port)
+        self.modbus.open()
+
+    def tearDown(self):
+        if self.modbus.scheduler is not None:
+            self.modbus.scheduler.stop()
+        self.modbus.close()
+        self.emulator.stop()
+
+    def create_scheduler(self, **kwargs):
+        # Queue transactions before the scheduler thread is started
+        scheduler = relay_modbus.Scheduler(self.modbus, **kwargs)
+        self.modbus.scheduler = scheduler
+        return scheduler
+
+    def transaction(self, relay, **kwargs):
+        return relay_modbus.Transaction(control_frame(relay), 8, append_crc_to_tx_frame=True,
+                                        **kwargs)
+
+    def get_relays(self):
+        # Relays of the transmitted frames
+        return [frame[3] for frame in self.emulator.frames]
+
+    def test_priority(self):
+        scheduler = self.create_scheduler()
+        relays = [1, 2, 3, 4]
+        futures = [scheduler.submit(self.transaction(relay, priority=priority))
+                   for relay, priority in zip(relays, (relay_modbus.PRIORITY_BACKGROUND,
+                                                       relay_modbus.PRIORITY_CONTROL,
+                                                       relay_modbus.PRIORITY_INTERACTIVE,
+                                                       relay_modbus.PRIORITY_CONTROL))]
+        scheduler.start()
+
+        for relay, future in zip(relays, futures):
+            self.assertEqual(future.result(1.0)[:6], control_frame(relay))
+        self.assertEqual(self.get_relays(), [3, 2, 4, 1])
+        self.assertEqual(scheduler.get_stats(relay_modbus.PRIORITY_CONTROL).transactions, 2)
+
+    def test_deadline(self):
+        scheduler = self.create_scheduler()
+        expired = scheduler.submit(self.transaction(1, deadline=0.0))
+        executed = scheduler.submit(self.transaction(2, deadline=10.0))
+        time.sleep(0.01)
+        scheduler.start()
+
+        self.assertRaises(relay_modbus.DeadlineException, expired.result, 1.0)
+        self.assertTrue(executed.result(1.0))
+        self.assertEqual(self.get_relays(), [2])
+        self.assertEqual(scheduler.get_stats(relay_modbus.PRIORITY_CONTROL).expired, 1)
+
+    def test_overflow_fail(self):
+        scheduler = self.create_scheduler(max_queue_depth=1, overflow=relay_modbus.OVERFLOW_FAIL)
+        queued = scheduler.submit(self.transaction(1))
+        self.assertRaises(relay_modbus.QueueFullException, scheduler.submit, self.transaction(2))
+        scheduler.start()
+
+        self.assertTrue(queued.result(1.0))
+        self.assertEqual(scheduler.get_stats(relay_modbus.PRIORITY_CONTROL).rejected, 1)
+
+    def test_overflow_drop_oldest(self):
+        scheduler = self.create_scheduler(max_queue_depth=1,
+                                          overflow=relay_modbus.OVERFLOW_DROP_OLDEST)
+        dropped = scheduler.submit(self.transaction(1,
+                                                    priority=relay_modbus.PRIORITY_BACKGROUND))
+        queued = scheduler.submit(self.transaction(2))
+
+        # Higher priority transaction is never dropped for a lower priority
+        self.assertRaises(relay_modbus.QueueFullException, scheduler.submit,
+                          self.transaction(3, priority=relay_modbus.PRIORITY_BACKGROUND))
+        scheduler.start()
+
+        self.assertRaises(relay_modbus.QueueFullException, dropped.result, 1.0)
+        self.assertTrue(queued.result(1.0))
+        self.assertEqual(self.get_relays(), [2])
+        self.assertEqual(scheduler.get_stats(relay_modbus.PRIORITY_BACKGROUND).dropped, 1)
+
+    def test_overflow_block(self):
+        scheduler = self.create_scheduler(max_queue_depth=1)
+        scheduler.start()
+
+        # Producer waits until the queue has space
+        futures = [scheduler.submit(self.transaction(relay)) for relay in range(1, 5)]
+        for future in futures:
+            self.assertTrue(future.result(1.0))
+        self.assertEqual(self.get_relays(), [1, 2, 3, 4])
+
+    def test_coalesce_replace(self):
+        scheduler = self.create_scheduler()
+        replacement = relay_modbus.Transaction(control_frame(1, CMD_OFF), 8,
+                                               append_crc_to_tx_frame=True)
+        merge = merge_with(relay_modbus.COALESCE_REPLACE, replacement)
+        futures = [scheduler.submit(self.transaction(1, key=1, merge=merge)) for _ in range(2)]
+        scheduler.start()
+
+        # Queued and new transaction complete with the result of the replacement
+        for future in futures:
+            self.assertEqual(future.result(1.0)[:6], control_frame(1, CMD_OFF))
+        self.assertEqual(replacement.future.result(1.0)[:6], control_frame(1, CMD_OFF))
+        self.assertEqual(len(self.emulator.frames), 1)
+
+    def test_coalesce_replace_priority(self):
+        scheduler = self.create_scheduler()
+        background = relay_modbus.PRIORITY_BACKGROUND
+        interactive = relay_modbus.PRIORITY_INTERACTIVE
+
+        def merge(pending, transaction):
+            return relay_modbus.COALESCE_REPLACE, transaction
+
+        futures = [scheduler.submit(self.transaction(relay, priority=background))
+                   for relay in range(2, 6)]
+        queued = scheduler.submit(self.transaction(1, key=1, merge=merge, priority=background))
+
+        # New transaction with a higher priority is executed before the queued transactions
+        scheduler.submit(self.transaction(1, key=1, merge=merge, priority=interactive))
+        self.assertEqual(scheduler.get_stats(background).queue_depth, 4)
+        self.assertEqual(scheduler.get_stats(interactive).queue_depth, 1)
+        scheduler.start()
+
+        for future in futures + [queued]:
+            self.assertTrue(future.result(1.0))
+        self.assertEqual(self.get_relays(), [1, 2, 3, 4, 5])
+
+    def test_coalesce_cancel(self):
+        scheduler = self.create_scheduler()
+        merge = merge_with(relay_modbus.COALESCE_CANCEL, 'cancelled')
+        futures = [scheduler.submit(self.transaction(1, key=1, merge=merge)) for _ in range(2)]
+        scheduler.start()
+
+        self.assertEqual([future.result(1.0) for future in futures], ['cancelled'] * 2)
+        self.assertEqual(scheduler.get_stats(relay_modbus.PRIORITY_CONTROL).coalesced, 2)
+        self.assertEqual(scheduler.queue_depth, 0)
+        self.assertEqual(self.emulator.frames, [])
+
+    def test_coalesce_answer(self):
+        scheduler = self.create_scheduler()
+        merge = merge_with(relay_modbus.COALESCE_ANSWER, len)
+        queued = scheduler.submit(self.transaction(1, key=1, merge=merge))
+        answered = scheduler.submit(self.transaction(1, key=1, merge=merge))
+        scheduler.start()
+
+        self.assertEqual(answered.result(1.0), len(queued.result(1.0)))
+        self.assertEqual(len(self.emulator.frames), 1)
+
+    def test_coalesce_group_barrier(self):
+        scheduler = self.create_scheduler()
+        merge = merge_with(relay_modbus.COALESCE_CANCEL, True)
+        scheduler.submit(self.transaction(1, key=1, group=1, merge=merge))
+
+        # Transaction of the whole group: Later transactions may not be merged before it
+        scheduler.submit(self.transaction(2, group=1))
+        scheduler.submit(self.transaction(1, key=1, group=1, merge=merge))
+        scheduler.start()
+        scheduler.submit(self.transaction(3)).result(1.0)
+
+        self.assertEqual(self.get_relays(), [1, 2, 1, 3])
+
+    def test_coalesce_disabled(self):
+        scheduler = self.create_scheduler(coalesce=False)
+        merge = merge_with(relay_modbus.COALESCE_CANCEL, True)
+        futures = [scheduler.submit(self.transaction(1, key=1, merge=merge)) for _ in range(2)]
+        scheduler.start()
+
+        for future in futures:
+            self.assertTrue(future.result(1.0))
+        self.assertEqual(self.get_relays(), [1, 1])
+
+    def test_coalesce_move_answers(self):
+        scheduler = self.create_scheduler()
+
+        def merge(pending, transaction):
+            if transaction.operation == 'read':
+                return relay_modbus.COALESCE_ANSWER, len
+            return relay_modbus.COALESCE_CANCEL, True
+
+        scheduler.submit(self.transaction(1, key=1, operation='write', merge=merge))
+        answered = scheduler.submit(self.transaction(1, key=1, operation='read', merge=merge,
+                                                     deadline=10.0))
+
+        # Queued write cancelled: Answered read is queued itself
+        scheduler.submit(self.transaction(1, key=1, operation='write', merge=merge))
+        scheduler.start()
+
+        self.assertEqual(answered.result(1.0)[:6], control_frame(1))
+        self.assertEqual(len(self.emulator.frames), 1)
+
+    def test_relay_board_coalesce(self):
+        scheduler = self.create_scheduler()
+        board = relay_boards.R421A08(self.modbus, 1)
+
+        # Latest on/off of a relay wins, two toggles cancel out, status from the queued command
+        on = board.submit_command(1, CMD_ON)
+        off = board.submit_command(1, CMD_OFF)
+        status = board.submit_status(1)
+        toggles = [board.submit_command(2, CMD_TOGGLE) for _ in range(2)]
+        scheduler.start()
+
+        self.assertTrue(on.result(1.0))
+        self.assertTrue(off.result(1.0))
+        self.assertEqual(status.result(1.0), 0)
+        self.assertEqual([toggle.result(1.0) for toggle in toggles], [True, True])
+        self.assertEqual(len(self.emulator.frames), 1)
+        self.assertEqual(self.emulator.relays[1][:2], [0, 0])
+
+    def test_relay_board_coalesce_cache(self):
+        scheduler = self.create_scheduler()
+        board = relay_boards.R421A08(self.modbus, 1, cache_ttl=60.0)
+
+        # Concurrent on and off of a relay are merged into one off frame
+        threads = [threading.Thread(target=board.on, args=(1, )),
+                   threading.Thread(target=board.off, args=(1, ))]
+        for thread in threads:
+            thread.start()
+            while scheduler.queue_depth == 0:
+                time.sleep(0.001)
+        while scheduler.get_stats(relay_modbus.PRIORITY_CONTROL).coalesced == 0:
+            time.sleep(0.001)
+        scheduler.start()
+        for thread in threads:
+            thread.join(1.0)
+
+        # Shadow state from the transmitted frame
+        self.assertEqual(self.get_relays(), [1])
+        self.assertEqual(self.emulator.relays[1][0], 0)
+        self.assertEqual(board.get_status(1), 0)
+        self.assertEqual(board.cache_hits, 1)
+
+    def test_relay_board_async(self):
+        board = relay_boards.R421A08(self.modbus, 1)
+
+        futures = [board.on_async(1), board.on_all_async(), board.get_status_all_async()]
+        combined = relay_modbus.combine_futures(futures, list)
+
+        self.assertIsNotNone(self.modbus.scheduler)
+        self.assertEqual(combined.result(1.0),
+                         [True, True, dict((relay, 1) for relay in range(1, 9))])
+        self.assertTrue(board.off_all_async().result(1.0))
+        self.assertEqual(board.get_status_mask(), 0)
+
+
+class CombineFuturesTest(unittest.TestCase):
+    def test_result(self):
+        futures = [Future() for _ in range(3)]
+        combined = relay_modbus.combine_futures(futures, sum)
+
+        for value, future in enumerate(futures):
+            self.assertFalse(combined.done())
+            future.set_result(value)
+        self.assertEqual(combined.result(0), 3)
+
+    def test_no_futures(self):
+        self.assertEqual(relay_modbus.combine_futures([], list).result(0), [])
+
+    def test_exception(self):
+        futures = [Future(), Future()]
+        combined = relay_modbus.combine_futures(futures, list)
+
+        futures[1].set_exception(relay_modbus.TransferException('Error'))
+        self.assertRaises(relay_modbus.TransferException, combined.result, 0)
+        futures[0].set_result(1)
+
+    def test_cancelled(self):
+        futures = [Future()]
+        combined = relay_modbus.combine_futures(futures, list)
+
+        futures[0].cancel()
+        self.assertRaises(relay_modbus.TransferException, combined.result, 0)
@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+#
+# MIT License
+#
+# Copyright (c) 2018 Erriez
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+import threading
+import time
+import unittest
+
+import relay_modbus
+
+
+class SingleFlightTest(unittest.TestCase):
+    def test_concurrent_calls_shared(self):
+        single_flight = relay_modbus.SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def read():
+            started.set()
+            release.wait(1.0)
+            return {1: 0, 2: 1}
+
+        owner = threading.Thread(target=lambda: results.append(single_flight.do('key', read)))
+        owner.start()
+        started.wait(1.0)
+
+        waiters = [threading.Thread(target=lambda: results.append(single_flight.do('key', read)))
+                   for _ in range(3)]
+        for waiter in waiters:
+            waiter.start()
+        while single_flight.shared < 3:
+            time.sleep(0.001)
+        release.set()
+
+        owner.join()
+        for waiter in waiters:
+            waiter.join()
+
+        self.assertEqual(single_flight.calls, 1)
+        self.assertEqual(single_flight.shared, 3)
+        self.assertEqual(results, [{1: 0, 2: 1}] * 4)
+        self.assertFalse(single_flight.is_in_flight('key'))
+
+    def test_sequential_calls_not_shared(self):
+        single_flight = relay_modbus.SingleFlight()
+        self.assertEqual(single_flight.do('key', lambda value: value, 1), 1)
+        self.assertEqual(single_flight.do('key', lambda value: value, 2), 2)
+        self.assertEqual(single_flight.calls, 2)
+        self.assertEqual(single_flight.shared, 0)
+
+    def test_exception(self):
+        single_flight = relay_modbus.SingleFlight()
+
+        def fail():
+            raise relay_modbus.TransferException('Error')
+
+        self.assertRaises(relay_modbus.TransferException, single_flight.do, 'key', fail)
+        self.assertFalse(single_flight.is_in_flight('key'))
+
+    def test_no_wait(self):
+        single_flight = relay_modbus.SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def read(value):
+            started.set()
+            release.wait(1.0)
+            return value
+
+        owner = threading.Thread(target=single_flight.do, args=('key', read, 1))
+        owner.start()
+        started.wait(1.0)
+
+        # Caller which may not wait executes the function itself while the owner is blocked
+        self.assertEqual(single_flight.do('key', lambda value: value, 2, wait=False), 2)
+        self.assertTrue(single_flight.is_in_flight('key'))
+        release.set()
+        owner.join()
+
+        self.assertEqual(single_flight.calls, 2)
+        self.assertEqual(single_flight.shared, 0)